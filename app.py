@@ -1,6 +1,8 @@
-from flask import Flask, send_from_directory
+from flask import Flask
 from server.config import app
 from server.routes import register_routes
+from server.commands import register_commands
+from server.sqlite_profile import configure_sqlite
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -9,13 +11,11 @@ load_dotenv()
 # Register routes
 register_routes(app)
 
-@app.route('/user-profiles/<filename>')
-def serve_profile_image(filename):
-    return send_from_directory('public/user-profiles', filename)
+# Register CLI commands (flask <command>)
+register_commands(app)
 
-@app.route('/dj-profiles/<filename>')
-def serve_dj_profile_image(filename):
-    return send_from_directory('public/dj-profiles', filename)
+# WAL, pragmas and a serialized writer when the database is SQLite
+configure_sqlite(app)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,123 @@
+"""Time relationship loads with and without the association-table indexes.
+
+Builds a throwaway database (SQLite unless --database-url is given), fills it with
+--djs DJs plus their genre, subgenre, venue and favourite rows, then runs the same
+workloads twice: once with the association indexes dropped and once with them in place.
+
+    python -m benchmarks.bench_association_indexes --djs 20000
+"""
+import argparse
+import random
+import time
+from .common import GENRES, VENUES, insert_batched, migrate, populate, remove_database, use_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--djs', type=int, default=20000)
+    parser.add_argument('--per-dj', type=int, default=3, help='genres, subgenres and venues per DJ')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--favourites', type=int, default=25, help='favourite DJs per user')
+    parser.add_argument('--samples', type=int, default=300, help='operations timed per workload')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    return parser.parse_args()
+
+
+args = parse_args()
+args.database_url, database_file = use_database(args.database_url)
+
+from sqlalchemy import func, select, text
+from app import app
+from server.config import db
+from server.facets import facet_criteria
+from server.models.dj import Dj, DjGenre, DjSubgenre, DjVenue
+from server.models.user import User, user_dj_favourites
+
+INDEXED_TABLES = (DjGenre.__table__, DjSubgenre.__table__, DjVenue.__table__, user_dj_favourites)
+
+
+def populate_with_favourites(rng):
+    rows = populate(rng, args.djs, args.per_dj)
+    # Users are inserted directly; hashing thousands of passwords would dominate the setup
+    insert_batched(User, [{'username': f'user{u}', '_hashed_password': '-', 'is_admin': False} for u in range(1, args.users + 1)])
+    insert_batched(user_dj_favourites, [
+        {'user_id': user_id, 'dj_id': dj_id}
+        for user_id in range(1, args.users + 1) for dj_id in rng.sample(range(1, args.djs + 1), args.favourites)
+    ])
+    db.session.commit()
+    return rows + args.users * args.favourites
+
+
+def analyze():
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+
+def set_indexes(present):
+    for table in INDEXED_TABLES:
+        for index in table.indexes:
+            if present:
+                index.create(db.engine, checkfirst=True)
+            else:
+                index.drop(db.engine, checkfirst=True)
+    analyze()
+
+
+def load_dj(dj_id):
+    # What ViewDj does: one DJ with its genres, subgenres and venues
+    dj = Dj.catalog_query().filter(Dj.id == dj_id).one()
+    return len(dj.genres) + len(dj.subgenres) + len(dj.venues)
+
+
+def djs_at_venue(venue_id):
+    return len(db.session.execute(select(DjVenue.dj_id).where(DjVenue.venue_id == venue_id)).all())
+
+
+def user_favourites(user_id):
+    return len(db.session.get(User, user_id).favourite_djs())
+
+
+def genre_facet(genre_id):
+    criteria = facet_criteria(genres=[f'Genre {genre_id}'])
+    return db.session.execute(select(func.count(Dj.id)).where(*criteria)).scalar()
+
+
+def workloads(rng):
+    return (
+        ('load one DJ with relationships', load_dj, [rng.randint(1, args.djs) for _ in range(args.samples)]),
+        ('DJs at a venue', djs_at_venue, [rng.randint(1, VENUES) for _ in range(args.samples)]),
+        ("a user's favourite DJs", user_favourites, [rng.randint(1, args.users) for _ in range(args.samples)]),
+        ('count DJs in a genre', genre_facet, [rng.randint(1, GENRES) for _ in range(args.samples)]),
+    )
+
+
+def run(workload):
+    _, operation, samples = workload
+    started = time.perf_counter()
+    for sample in samples:
+        operation(sample)
+        db.session.expunge_all()
+    db.session.rollback()
+    return (time.perf_counter() - started) * 1000 / len(samples)
+
+
+def main():
+    with app.app_context():
+        migrate()
+        rows = populate_with_favourites(random.Random(42))
+        print(f'{args.djs} DJs, {rows} association rows, {args.samples} operations per workload\n')
+
+        timings = {}
+        for present in (False, True):
+            set_indexes(present)
+            timings[present] = [run(workload) for workload in workloads(random.Random(7))]
+
+        print(f"{'workload':34} {'no indexes':>12} {'indexes':>12} {'speedup':>9}")
+        for (name, _, _), before, after in zip(workloads(random.Random(7)), timings[False], timings[True]):
+            print(f'{name:34} {before:>9.3f} ms {after:>9.3f} ms {before / after:>8.1f}x')
+
+    remove_database(database_file)
+
+
+if __name__ == '__main__':
+    main()
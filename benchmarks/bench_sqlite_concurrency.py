@@ -0,0 +1,127 @@
+"""Measure read throughput while writers keep updating DJs, per SQLite profile.
+
+Builds a throwaway SQLite database with --djs DJs, then for each profile runs --readers
+threads fetching random DJs (GET /api/dj/<id>) alongside --writers threads patching random
+DJs (PATCH /api/dj/update/<id>) for --seconds, through the app's test client.
+
+'default' is SQLite as the app used to open it: rollback journal, synchronous=FULL, the
+default cache, no mmap and no writer queue. 'production' is the SQLITE_* configuration.
+
+    python -m benchmarks.bench_sqlite_concurrency --readers 4 --writers 2 --seconds 10
+"""
+import argparse
+import logging
+import random
+import threading
+import time
+from .common import VENUES, migrate, populate, remove_database, use_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--djs', type=int, default=5000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    return parser.parse_args()
+
+
+args = parse_args()
+_, database_file = use_database()
+
+from app import app
+from server.config import db
+from server.documents import rebuild_documents
+
+SETTINGS = ('SQLITE_JOURNAL_MODE', 'SQLITE_SYNCHRONOUS', 'SQLITE_CACHE_SIZE', 'SQLITE_MMAP_SIZE',
+            'SQLITE_BUSY_TIMEOUT_MS', 'SQLITE_SERIALIZE_WRITES')
+PROFILES = {
+    'default': {
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_CACHE_SIZE': -2000,
+        'SQLITE_MMAP_SIZE': 0,
+        # Python's sqlite3 waits 5 seconds for a lock unless told otherwise
+        'SQLITE_BUSY_TIMEOUT_MS': 5000,
+        'SQLITE_SERIALIZE_WRITES': False,
+    },
+    'production': {setting: app.config[setting] for setting in SETTINGS},
+}
+
+
+class Counter:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, started, ok):
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            if ok:
+                self.latencies.append(elapsed)
+            else:
+                self.errors += 1
+
+    def percentile(self, fraction):
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else float('nan')
+
+
+def reader(seed, deadline, counter):
+    rng, client = random.Random(seed), app.test_client()
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = client.get(f'/api/dj/{rng.randint(1, args.djs)}')
+        counter.record(started, response.status_code == 200)
+
+
+def writer(seed, deadline, counter):
+    rng, client = random.Random(seed), app.test_client()
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = client.patch(f'/api/dj/update/{rng.randint(1, args.djs)}', json={
+            'produces': rng.random() < 0.5,
+            'venues': [f'Venue {rng.randint(1, VENUES)}'],
+        })
+        counter.record(started, response.status_code == 200)
+
+
+def run(profile):
+    app.config.update(PROFILES[profile])
+    # New connections pick up the profile's pragmas
+    with app.app_context():
+        db.engine.dispose()
+
+    reads, writes = Counter(), Counter()
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=reader, args=(n, deadline, reads)) for n in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(1000 + n, deadline, writes)) for n in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return reads, writes
+
+
+def main():
+    # Failed requests are counted, not logged
+    logging.disable(logging.CRITICAL)
+    with app.app_context():
+        migrate()
+        populate(random.Random(42), args.djs, per_dj=1)
+        rebuild_documents()
+    print(f'{args.djs} DJs, {args.readers} readers, {args.writers} writers, {args.seconds:g}s per profile\n')
+
+    print(f"{'profile':12} {'reads/s':>9} {'read p50':>10} {'read p99':>10} {'read errors':>12} {'writes/s':>9} {'write errors':>13}")
+    for profile in PROFILES:
+        reads, writes = run(profile)
+        print(f'{profile:12} {len(reads.latencies) / args.seconds:>9.1f} {reads.percentile(0.5):>7.2f} ms '
+              f'{reads.percentile(0.99):>7.2f} ms {reads.errors:>12} {len(writes.latencies) / args.seconds:>9.1f} '
+              f'{writes.errors:>13}')
+
+    remove_database(database_file)
+
+
+if __name__ == '__main__':
+    main()
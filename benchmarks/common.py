@@ -0,0 +1,74 @@
+"""Database setup shared by the benchmark scripts.
+
+use_database() has to run before anything imports app or server, so the server imports
+below are made inside the functions that need them.
+"""
+import os
+import tempfile
+from sqlalchemy import insert
+
+GENRES, SUBGENRES_PER_GENRE, VENUES = 40, 10, 500
+INSERT_BATCH = 10000
+
+
+def use_database(database_url=None):
+    # Points the app at database_url, or at a new temporary SQLite file; returns the URL and that file
+    database_file = None
+    if database_url is None:
+        database_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        database_url = f'sqlite:///{database_file}'
+    # server.config reads the URI at import time
+    os.environ['SQLALCHEMY_DATABASE_URI'] = database_url
+    return database_url, database_file
+
+
+def remove_database(database_file):
+    # The temporary file from use_database(), with its journal files; None when a URL was given
+    if database_file is None:
+        return
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(database_file + suffix):
+            os.remove(database_file + suffix)
+
+
+def migrate():
+    import flask_migrate
+    flask_migrate.upgrade(directory=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations'))
+
+
+def insert_batched(table, rows):
+    from server.config import db
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.session.execute(insert(table), rows[start:start + INSERT_BATCH])
+
+
+def populate(rng, djs, per_dj):
+    # Genres, subgenres, venues and djs DJs with per_dj of each; returns the number of association rows
+    from server.config import db
+    from server.models.dj import Dj, Genre, Subgenre, Venue, DjGenre, DjSubgenre, DjVenue
+
+    insert_batched(Genre, [{'title': f'Genre {g}', 'title_key': f'genre {g}'} for g in range(1, GENRES + 1)])
+    insert_batched(Subgenre, [
+        {'genre_id': g, 'subtitle': f'Sub {g}.{s}', 'subtitle_key': f'sub {g}.{s}'}
+        for g in range(1, GENRES + 1) for s in range(SUBGENRES_PER_GENRE)
+    ])
+    insert_batched(Venue, [{'venuename': f'Venue {v}', 'venuename_key': f'venue {v}'} for v in range(1, VENUES + 1)])
+    insert_batched(Dj, [
+        {'name': f'DJ {d}', 'name_key': f'dj {d}', 'city': 'London', 'city_key': 'london', 'produces': d % 2 == 0}
+        for d in range(1, djs + 1)
+    ])
+
+    dj_genres, dj_subgenres, dj_venues = [], [], []
+    for dj_id in range(1, djs + 1):
+        genre_ids = rng.sample(range(1, GENRES + 1), per_dj)
+        dj_genres += [{'dj_id': dj_id, 'genre_id': genre_id} for genre_id in genre_ids]
+        dj_subgenres += [
+            {'dj_id': dj_id, 'subgenre_id': (genre_id - 1) * SUBGENRES_PER_GENRE + rng.randrange(SUBGENRES_PER_GENRE) + 1}
+            for genre_id in genre_ids
+        ]
+        dj_venues += [{'dj_id': dj_id, 'venue_id': venue_id} for venue_id in rng.sample(range(1, VENUES + 1), per_dj)]
+    insert_batched(DjGenre, dj_genres)
+    insert_batched(DjSubgenre, dj_subgenres)
+    insert_batched(DjVenue, dj_venues)
+    db.session.commit()
+    return len(dj_genres) + len(dj_subgenres) + len(dj_venues)
@@ -19,7 +19,7 @@ export default function DjPage() {
             ]);
             setDj(djResponse.data);
             setUser(userResponse.data);
-            setFavourites(userResponse.data.favourites || []);
+            setFavourites(userResponse.data.favourite_ids || []);
             setError(null);
         } catch (error) {
             console.error('Error fetching data:', error);
@@ -33,13 +33,13 @@ export default function DjPage() {
 
     const handleToggleFavourite = async () => {
         try {
-            const isFavourite = favourites.some(fav => fav.id === dj.id);
+            const isFavourite = favourites.includes(dj.id);
             if (isFavourite) {
                 await axios.delete('/api/me/favourites', { data: { dj_id: dj.id }, withCredentials: true });
-                setFavourites(prevFavourites => prevFavourites.filter(fav => fav.id !== dj.id));
+                setFavourites(prevFavourites => prevFavourites.filter(id => id !== dj.id));
             } else {
                 await axios.post('/api/me/favourites', { dj_id: dj.id }, { withCredentials: true });
-                setFavourites(prevFavourites => [...prevFavourites, dj]);
+                setFavourites(prevFavourites => [...prevFavourites, dj.id]);
             }
         } catch (error) {
             console.error('Error updating favourites:', error);
@@ -76,8 +76,8 @@ export default function DjPage() {
             <div className="dj-header">
                 <h1 className="dj-name">{dj.name}</h1>
                 <button className="btn heart-container" onClick={handleToggleFavourite}>
-                    <span className={`favourite-icon ${favourites.some(fav => fav.id === dj.id) ? 'filled' : ''}`}>
-                        {favourites.some(fav => fav.id === dj.id) ? '❤️' : '♡'}
+                    <span className={`favourite-icon ${favourites.includes(dj.id) ? 'filled' : ''}`}>
+                        {favourites.includes(dj.id) ? '❤️' : '♡'}
                     </span>
                 </button>
             </div>
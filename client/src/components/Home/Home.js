@@ -29,7 +29,7 @@ export default function Home({ onLogout }) {
             <div className="header">
                 <div className="profile-picture-section">
                     <img
-                    src={user?.profile_image_url ? `/user-profiles/${user.profile_image_url}` : '/img/default-profile.jpg'}
+                    src={user?.profile_image_variants ? user.profile_image_variants.medium : '/img/default-profile.jpg'}
                     alt="Profile"
                         className="profile-picture"
                     />
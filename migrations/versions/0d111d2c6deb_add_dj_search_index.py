@@ -0,0 +1,65 @@
+"""Add dj_search full-text index
+
+Revision ID: 0d111d2c6deb
+Revises: 179587c3142a
+Create Date: 2026-10-18 10:02:17.530418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0d111d2c6deb'
+down_revision = '179587c3142a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE dj_search USING fts5("
+            "name, city, genres, subgenres, venues, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        op.execute(
+            "INSERT INTO dj_search (rowid, name, city, genres, subgenres, venues) "
+            "SELECT djs.id, djs.name, djs.city, "
+            "(SELECT group_concat(genres.title, ' ') FROM dj_genres JOIN genres ON genres.id = dj_genres.genre_id "
+            "WHERE dj_genres.dj_id = djs.id), "
+            "(SELECT group_concat(subgenres.subtitle, ' ') FROM dj_subgenres JOIN subgenres ON subgenres.id = dj_subgenres.subgenre_id "
+            "WHERE dj_subgenres.dj_id = djs.id), "
+            "(SELECT group_concat(venues.venuename, ' ') FROM dj_venues JOIN venues ON venues.id = dj_venues.venue_id "
+            "WHERE dj_venues.dj_id = djs.id) "
+            "FROM djs"
+        )
+    elif dialect == 'postgresql':
+        op.create_table('dj_search',
+        sa.Column('dj_id', sa.Integer(), nullable=False),
+        sa.Column('document', postgresql.TSVECTOR(), nullable=False),
+        sa.PrimaryKeyConstraint('dj_id')
+        )
+        op.create_index('ix_dj_search_document', 'dj_search', ['document'], unique=False, postgresql_using='gin')
+        op.execute(
+            "INSERT INTO dj_search (dj_id, document) "
+            "SELECT djs.id, "
+            "setweight(to_tsvector('simple', djs.name), 'A') || "
+            "setweight(to_tsvector('simple', coalesce((SELECT string_agg(genres.title, ' ') FROM dj_genres "
+            "JOIN genres ON genres.id = dj_genres.genre_id WHERE dj_genres.dj_id = djs.id), '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce((SELECT string_agg(subgenres.subtitle, ' ') FROM dj_subgenres "
+            "JOIN subgenres ON subgenres.id = dj_subgenres.subgenre_id WHERE dj_subgenres.dj_id = djs.id), '')), 'B') || "
+            "setweight(to_tsvector('simple', djs.city), 'C') || "
+            "setweight(to_tsvector('simple', coalesce((SELECT string_agg(venues.venuename, ' ') FROM dj_venues "
+            "JOIN venues ON venues.id = dj_venues.venue_id WHERE dj_venues.dj_id = djs.id), '')), 'C') "
+            "FROM djs"
+        )
+    else:
+        raise RuntimeError(f'dj_search supports the sqlite and postgresql dialects, not {dialect}')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_dj_search_document', table_name='dj_search')
+    op.execute("DROP TABLE dj_search")
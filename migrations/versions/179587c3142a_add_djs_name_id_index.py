@@ -0,0 +1,24 @@
+"""Add djs (name, id) index for keyset pagination
+
+Revision ID: 179587c3142a
+Revises: 2839741eeec4
+Create Date: 2026-10-18 09:12:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '179587c3142a'
+down_revision = '2839741eeec4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_djs_name_id', 'djs', ['name', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_djs_name_id', table_name='djs')
@@ -0,0 +1,42 @@
+"""Add reference-counted media files
+
+Revision ID: 2e37f4e0dc95
+Revises: 7a21b4d4b4aa
+Create Date: 2026-10-18 16:21:09.552104
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e37f4e0dc95'
+down_revision = '7a21b4d4b4aa'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('media_files',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('filename', sa.String(), nullable=False),
+    sa.Column('refcount', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('kind', 'filename', name='unique_media_file')
+    )
+    # Existing timestamped uploads become tracked files, each referenced by whoever points at it
+    op.execute(
+        "INSERT INTO media_files (kind, filename, refcount) "
+        "SELECT 'user-profiles', profile_image_url, count(*) FROM users "
+        "WHERE profile_image_url IS NOT NULL GROUP BY profile_image_url"
+    )
+    op.execute(
+        "INSERT INTO media_files (kind, filename, refcount) "
+        "SELECT 'dj-profiles', dj_profile_picture, count(*) FROM djs "
+        "WHERE dj_profile_picture IS NOT NULL GROUP BY dj_profile_picture"
+    )
+
+
+def downgrade():
+    op.drop_table('media_files')
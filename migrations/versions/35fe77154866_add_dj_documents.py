@@ -0,0 +1,31 @@
+"""Add dj_documents read model
+
+Revision ID: 35fe77154866
+Revises: 2e37f4e0dc95
+Create Date: 2026-10-18 17:04:41.208316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '35fe77154866'
+down_revision = '2e37f4e0dc95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Left empty: documents are serialized by the app, so backfill with `flask rebuild-dj-documents`.
+    # Until then readers build any missing document on the fly.
+    op.create_table('dj_documents',
+    sa.Column('dj_id', sa.Integer(), nullable=False),
+    sa.Column('document', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['dj_id'], ['djs.id'], ),
+    sa.PrimaryKeyConstraint('dj_id')
+    )
+
+
+def downgrade():
+    op.drop_table('dj_documents')
@@ -0,0 +1,33 @@
+"""Add catalog and per-DJ versions
+
+Revision ID: 4c50f7808748
+Revises: 0d111d2c6deb
+Create Date: 2026-10-18 11:26:53.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c50f7808748'
+down_revision = '0d111d2c6deb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    catalog_version = op.create_table('catalog_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(catalog_version, [{'id': 1, 'version': 1}])
+    with op.batch_alter_table('djs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('djs', schema=None) as batch_op:
+        batch_op.drop_column('version')
+    op.drop_table('catalog_version')
@@ -0,0 +1,60 @@
+"""Add unique and reverse indexes on the association tables
+
+Revision ID: 7a21b4d4b4aa
+Revises: 9a008500217f
+Create Date: 2026-10-18 15:02:41.318275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a21b4d4b4aa'
+down_revision = '9a008500217f'
+branch_labels = None
+depends_on = None
+
+# (table, owning column, other column); the unique index leads with dj_id / user_id and the
+# reverse index serves lookups from the other side ("DJs at this venue", "fans of this DJ")
+ASSOCIATIONS = (
+    ('dj_genres', 'dj_id', 'genre_id'),
+    ('dj_subgenres', 'dj_id', 'subgenre_id'),
+    ('dj_venues', 'dj_id', 'venue_id'),
+    ('user_dj_favourites', 'user_id', 'dj_id'),
+)
+
+
+def drop_duplicate_pairs(bind, table, left, right):
+    # Rows with a NULL side never collide under a unique index, so only complete pairs are folded
+    if table == 'user_dj_favourites':
+        # No surrogate key to keep one row by, so rewrite the table from its distinct pairs
+        duplicated = bind.execute(sa.text(
+            f"SELECT 1 FROM {table} WHERE {left} IS NOT NULL AND {right} IS NOT NULL "
+            f"GROUP BY {left}, {right} HAVING count(*) > 1"
+        )).first()
+        if duplicated:
+            bind.execute(sa.text(f"CREATE TEMPORARY TABLE {table}_distinct AS SELECT DISTINCT {left}, {right} FROM {table}"))
+            bind.execute(sa.text(f"DELETE FROM {table}"))
+            bind.execute(sa.text(f"INSERT INTO {table} ({left}, {right}) SELECT {left}, {right} FROM {table}_distinct"))
+            bind.execute(sa.text(f"DROP TABLE {table}_distinct"))
+        return
+
+    bind.execute(sa.text(
+        f"DELETE FROM {table} WHERE {left} IS NOT NULL AND {right} IS NOT NULL AND id NOT IN "
+        f"(SELECT min(id) FROM {table} WHERE {left} IS NOT NULL AND {right} IS NOT NULL GROUP BY {left}, {right})"
+    ))
+
+
+def upgrade():
+    bind = op.get_bind()
+    for table, left, right in ASSOCIATIONS:
+        drop_duplicate_pairs(bind, table, left, right)
+        op.create_index(f'ix_{table}_{left}_{right}', table, [left, right], unique=True)
+        op.create_index(f'ix_{table}_{right}_{left}', table, [right, left], unique=False)
+
+
+def downgrade():
+    for table, left, right in reversed(ASSOCIATIONS):
+        op.drop_index(f'ix_{table}_{right}_{left}', table_name=table)
+        op.drop_index(f'ix_{table}_{left}_{right}', table_name=table)
@@ -0,0 +1,148 @@
+"""Add normalized lookup keys for DJs, genres, subgenres and venues
+
+Revision ID: 9a008500217f
+Revises: 4c50f7808748
+Create Date: 2026-10-18 13:40:08.661930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a008500217f'
+down_revision = '4c50f7808748'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# Frozen copies of server.models.dj.GENRE_ALIASES / normalize_key / genre_key as of this revision
+GENRE_ALIASES = {
+    "drum n bass": "Drum & Bass",
+    "dnb": "Drum & Bass",
+    "d&b": "Drum & Bass",
+    "drum and bass": "Drum & Bass",
+    "d & b": "Drum & Bass",
+    "d n b": "Drum & Bass",
+    "dubstep": "Dubstep",
+    "140": "Dubstep",
+}
+
+
+def normalize_key(value):
+    return ' '.join(value.split()).casefold()
+
+
+def genre_key(title):
+    key = normalize_key(title)
+    return normalize_key(GENRE_ALIASES.get(key, key))
+
+
+def backfill(bind, table, key_columns):
+    # key_columns: {key column: (source column, key function)}; walks the table by id, BATCH_SIZE rows at a time
+    sources = ', '.join(source for source, _ in key_columns.values())
+    assignments = ', '.join(f'{key} = :{key}' for key in key_columns)
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text(
+            f"SELECT id, {sources} FROM {table} WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': BATCH_SIZE}).mappings().all()
+        if not rows:
+            break
+        bind.execute(sa.text(f"UPDATE {table} SET {assignments} WHERE id = :id"), [
+            dict({key: to_key(row[source]) for key, (source, to_key) in key_columns.items()}, id=row['id'])
+            for row in rows
+        ])
+        last_id = rows[-1]['id']
+
+
+def merge_duplicates(bind, table, key_columns, references):
+    """Fold rows that now share a key into the lowest id, repointing references first."""
+    keys = ', '.join(key_columns)
+    keeper, duplicates = {}, {}
+    for row in bind.execute(sa.text(f"SELECT id, {keys} FROM {table} ORDER BY id")):
+        keeper.setdefault(tuple(row[1:]), row[0])
+        if keeper[tuple(row[1:])] != row[0]:
+            duplicates[row[0]] = keeper[tuple(row[1:])]
+    for duplicate, kept in duplicates.items():
+        for ref_table, ref_column in references:
+            bind.execute(sa.text(f"UPDATE {ref_table} SET {ref_column} = :kept WHERE {ref_column} = :duplicate"),
+                         {'kept': kept, 'duplicate': duplicate})
+        bind.execute(sa.text(f"DELETE FROM {table} WHERE id = :duplicate"), {'duplicate': duplicate})
+
+
+def dj_key_clashes(bind):
+    counts, last_id = {}, 0
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT id, name, city FROM djs WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': BATCH_SIZE}).all()
+        if not rows:
+            break
+        for _, name, city in rows:
+            key = (normalize_key(name), normalize_key(city))
+            counts[key] = counts.get(key, 0) + 1
+        last_id = rows[-1][0]
+    return [(name, city, count) for (name, city), count in counts.items() if count > 1]
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # DJs are not merged automatically: two rows could be different people, so stop (before
+    # touching the schema) and say which
+    clashes = dj_key_clashes(bind)
+    if clashes:
+        listed = '; '.join(f'{name!r} in {city!r} ({count} rows)' for name, city, count in clashes)
+        raise RuntimeError(f'DJs differing only in case or spacing must be resolved before upgrading: {listed}')
+
+    with op.batch_alter_table('djs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('name_key', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('city_key', sa.String(), nullable=True))
+    with op.batch_alter_table('genres', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('title_key', sa.String(), nullable=True))
+    with op.batch_alter_table('subgenres', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('subtitle_key', sa.String(), nullable=True))
+    with op.batch_alter_table('venues', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('venuename_key', sa.String(), nullable=True))
+
+    backfill(bind, 'djs', {'name_key': ('name', normalize_key), 'city_key': ('city', normalize_key)})
+    backfill(bind, 'genres', {'title_key': ('title', genre_key)})
+    backfill(bind, 'subgenres', {'subtitle_key': ('subtitle', genre_key)})
+    backfill(bind, 'venues', {'venuename_key': ('venuename', normalize_key)})
+
+    # Case and alias variants created before this revision become one row each
+    merge_duplicates(bind, 'genres', ['title_key'], [('dj_genres', 'genre_id'), ('subgenres', 'genre_id')])
+    merge_duplicates(bind, 'subgenres', ['genre_id', 'subtitle_key'], [('dj_subgenres', 'subgenre_id')])
+    merge_duplicates(bind, 'venues', ['venuename_key'], [('dj_venues', 'venue_id')])
+
+    with op.batch_alter_table('djs', schema=None) as batch_op:
+        batch_op.alter_column('name_key', existing_type=sa.String(), nullable=False)
+        batch_op.alter_column('city_key', existing_type=sa.String(), nullable=False)
+        batch_op.create_index('ix_djs_name_key_city_key', ['name_key', 'city_key'], unique=True)
+    with op.batch_alter_table('genres', schema=None) as batch_op:
+        batch_op.alter_column('title_key', existing_type=sa.String(), nullable=False)
+        batch_op.create_index('ix_genres_title_key', ['title_key'], unique=True)
+    with op.batch_alter_table('subgenres', schema=None) as batch_op:
+        batch_op.alter_column('subtitle_key', existing_type=sa.String(), nullable=False)
+        batch_op.create_index('ix_subgenres_genre_id_subtitle_key', ['genre_id', 'subtitle_key'], unique=True)
+    with op.batch_alter_table('venues', schema=None) as batch_op:
+        batch_op.alter_column('venuename_key', existing_type=sa.String(), nullable=False)
+        batch_op.create_index('ix_venues_venuename_key', ['venuename_key'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('venues', schema=None) as batch_op:
+        batch_op.drop_index('ix_venues_venuename_key')
+        batch_op.drop_column('venuename_key')
+    with op.batch_alter_table('subgenres', schema=None) as batch_op:
+        batch_op.drop_index('ix_subgenres_genre_id_subtitle_key')
+        batch_op.drop_column('subtitle_key')
+    with op.batch_alter_table('genres', schema=None) as batch_op:
+        batch_op.drop_index('ix_genres_title_key')
+        batch_op.drop_column('title_key')
+    with op.batch_alter_table('djs', schema=None) as batch_op:
+        batch_op.drop_index('ix_djs_name_key_city_key')
+        batch_op.drop_column('city_key')
+        batch_op.drop_column('name_key')
@@ -1,8 +1,8 @@
 from server.config import app, db
-from server.models.dj import Dj
+from server.importer import delete_all_djs
 
 with app.app_context():
     # Delete all DJs
-    db.session.query(Dj).delete()
+    delete_all_djs()
     db.session.commit()
     print("All DJs have been deleted.")
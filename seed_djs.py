@@ -1,5 +1,6 @@
 from server.config import app, db
-from server.models.dj import Dj, Genre, Subgenre, Venue, DjGenre, DjSubgenre, DjVenue
+from server.models.dj import Genre, Subgenre, Venue
+from server.importer import import_djs, delete_all_djs
 
 # DJ Seed data
 djs_data = [
@@ -118,70 +119,17 @@ djs_data = [
 with app.app_context():
     try:
         # Delete existing data
-        db.session.query(DjGenre).delete()
-        db.session.query(DjSubgenre).delete()
-        db.session.query(DjVenue).delete()
+        delete_all_djs()
         db.session.query(Subgenre).delete()
         db.session.query(Venue).delete()
         db.session.query(Genre).delete()
-        db.session.query(Dj).delete()
         db.session.commit()
         print("All DJs, genres, subgenres, venues, and related entries have been deleted.")
-        
-        # Seed data
-        for dj_data in djs_data:
-            # Create or get genres
-            genre_objects = []
-            for genre in dj_data['genres']:
-                existing_genre = Genre.query.filter_by(title=genre).first()
-                if not existing_genre:
-                    existing_genre = Genre(title=genre)
-                    db.session.add(existing_genre)
-                genre_objects.append(existing_genre)
-            
-            # Create or get subgenres
-            subgenre_objects = []
-            for genre_title, subgenre_list in dj_data['subgenres'].items():
-                genre = Genre.query.filter_by(title=genre_title).first()
-                if not genre:
-                    raise ValueError(f"Genre '{genre_title}' not found in the database.")
-                
-                for subgenre_title in subgenre_list:
-                    existing_subgenre = Subgenre.query.filter_by(subtitle=subgenre_title, genre_id=genre.id).first()
-                    if not existing_subgenre:
-                        existing_subgenre = Subgenre(subtitle=subgenre_title, genre_id=genre.id)
-                        db.session.add(existing_subgenre)
-                    subgenre_objects.append(existing_subgenre)
-            
-            # Create or get venues
-            venue_objects = []
-            for venue_name in dj_data['venues']:
-                existing_venue = Venue.query.filter_by(venuename=venue_name).first()
-                if not existing_venue:
-                    existing_venue = Venue(venuename=venue_name)
-                    db.session.add(existing_venue)
-                venue_objects.append(existing_venue)
-            
-            # Create DJ
-            dj = Dj(
-                name=dj_data['name'],
-                produces=dj_data['produces'],
-                city=dj_data['city'],
-                dj_profile_picture=None
-            )
-            db.session.add(dj)
-            db.session.flush()  # Flush to get the DJ ID
-            
-            # Add genres and subgenres
-            for genre in genre_objects:
-                db.session.add(DjGenre(dj_id=dj.id, genre_id=genre.id))
-            for subgenre in subgenre_objects:
-                db.session.add(DjSubgenre(dj_id=dj.id, subgenre_id=subgenre.id))
-            for venue in venue_objects:
-                db.session.add(DjVenue(dj_id=dj.id, venue_id=venue.id))
-            
-            # Commit after each DJ
-            db.session.commit()
+
+        # Seed data, through the bulk importer so taxonomy lookups are set-based
+        report = import_djs(enumerate(djs_data, start=1))
+        for error in report['errors']:
+            print(f"DJ {error['row']}: {error['error']}")
         
         print("Seed data added successfully.")
         
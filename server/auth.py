@@ -0,0 +1,66 @@
+from collections import namedtuple
+from flask import g, has_request_context, session
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from .cache import TTLCache
+from .config import app, db
+from .models.user import User
+
+Identity = namedtuple('Identity', ['id', 'username', 'is_admin'])
+
+
+# User id -> Identity; the TTL bounds how long another worker serves a stale one
+identity_cache = TTLCache(app.config['IDENTITY_CACHE_TTL'], app.config['IDENTITY_CACHE_SIZE'])
+
+
+def _identity_of(user):
+    identity = Identity(user.id, user.username, bool(user.is_admin))
+    identity_cache.set(identity.id, identity)
+    return identity
+
+
+def current_identity():
+    # (id, username, is_admin) of the signed-in user, or None; resolved once per request, usually from the cache
+    if 'identity' not in g:
+        user_id = session.get('user_id')
+        identity = identity_cache.get(user_id) if user_id else None
+        if identity is None and user_id:
+            row = db.session.execute(select(User.id, User.username, User.is_admin).where(User.id == user_id)).first()
+            identity = row and _identity_of(row)
+        g.identity = identity
+    return g.identity
+
+
+def current_user():
+    # The signed-in User row, or None; loaded at most once per request
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        user = db.session.get(User, user_id) if user_id else None
+        g.current_user = user
+        g.identity = user and _identity_of(user)
+    return g.current_user
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_changed_users(session, flush_context):
+    changed = {obj.id for obj in session.deleted if isinstance(obj, User)}
+    changed.update(
+        obj.id for obj in session.dirty
+        if isinstance(obj, User) and session.is_modified(obj, include_collections=False)
+    )
+    if changed:
+        session.info.setdefault('changed_users', set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_identities(session):
+    for user_id in session.info.pop('changed_users', ()):
+        identity_cache.discard(user_id)
+        if has_request_context() and getattr(g.get('identity'), 'id', None) == user_id:
+            g.pop('identity')
+            g.pop('current_user', None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_users', None)
@@ -1,6 +1,6 @@
 from flask import Blueprint
 from flask_restful import Api
-from server.resources.dj_resource import (AddDj, ViewDjs, ViewDj, SearchDjs, UpdateDj, DeleteDj, GenreList, SubgenreList, VenueList, DJProfileImage, DeleteDJProfileImage)
+from server.resources.dj_resource import (AddDj, ViewDjs, ViewDj, SearchDjs, UpdateDj, DeleteDj, GenreList, SubgenreList, VenueList, DJProfileImage, DeleteDJProfileImage, ImportDjs)
 
 dj_blueprint = Blueprint('dj_blueprint', __name__)
 api = Api(dj_blueprint)
@@ -10,6 +10,7 @@ api.add_resource(AddDj, '/dj/add')
 api.add_resource(ViewDjs, '/djs')
 api.add_resource(ViewDj, '/dj/<int:dj_id>')
 api.add_resource(SearchDjs, '/djs/search')
+api.add_resource(ImportDjs, '/djs/import')
 api.add_resource(UpdateDj, '/dj/update/<int:dj_id>')
 api.add_resource(DeleteDj, '/dj/<int:dj_id>')
 api.add_resource(DJProfileImage, '/dj/profile-image/<int:dj_id>')
@@ -0,0 +1,13 @@
+from flask import Blueprint
+from server.media import send_media
+
+# Uploaded profile images, served from MEDIA_ROOT
+media_blueprint = Blueprint('media', __name__)
+
+@media_blueprint.route('/user-profiles/<filename>')
+def serve_profile_image(filename):
+    return send_media('user-profiles', filename)
+
+@media_blueprint.route('/dj-profiles/<filename>')
+def serve_dj_profile_image(filename):
+    return send_media('dj-profiles', filename)
@@ -1,6 +1,6 @@
 from flask import Blueprint
 from flask_restful import Api
-from server.resources.user_resource import Signup, Login, Logout, Me, Users, Favourites, ProfileImage, DeleteProfileImage
+from server.resources.user_resource import Signup, Login, Logout, Me, Users, Favourites, BulkFavourites, ProfileImage, DeleteProfileImage
 
 user_blueprint = Blueprint('user_blueprint', __name__)
 api = Api(user_blueprint)
@@ -13,5 +13,6 @@ api.add_resource(Me, '/me')
 api.add_resource(ProfileImage, '/me/user-profiles')
 api.add_resource(DeleteProfileImage, '/me/delete-profile-image')
 api.add_resource(Favourites, '/me/favourites')
+api.add_resource(BulkFavourites, '/me/favourites/bulk')
 api.add_resource(Users, '/users', '/users/<int:user_id>')
 
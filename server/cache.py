@@ -0,0 +1,87 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .config import app
+from .models.dj import Genre, Subgenre, Venue
+
+CacheEntry = namedtuple('CacheEntry', ['body', 'etag'])
+
+
+class TTLCache:
+    # Thread-safe LRU whose entries expire after ttl seconds
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hold_until = 0
+
+    def get(self, key):
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None:
+                return None
+            value, expires = cached
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._hold_until:
+                return value
+            self._entries[key] = (value, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self, hold=0):
+        # For hold seconds nothing is stored, e.g. while replicas may still return the old data
+        with self._lock:
+            self._entries.clear()
+            self._hold_until = time.monotonic() + hold
+
+
+class BytesCache(TTLCache):
+    # Serialized response bodies and their ETags
+    def set(self, key, body):
+        return super().set(key, CacheEntry(body, hashlib.sha256(body).hexdigest()))
+
+
+# Genre, subgenre and venue lists; only change when a write creates a new taxonomy row. Writes
+# through this process clear it straight away, the TTL bounds how long other workers serve stale lists
+taxonomy_cache = BytesCache(app.config['TAXONOMY_CACHE_TTL'], app.config['TAXONOMY_CACHE_SIZE'])
+
+
+def mark_taxonomy_changed(session):
+    # For writers that insert taxonomy rows with Core statements, which the flush hook cannot see
+    session.info['taxonomy_changed'] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_new_taxonomy(session, flush_context):
+    if any(isinstance(obj, (Genre, Subgenre, Venue)) for obj in session.new):
+        mark_taxonomy_changed(session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_taxonomy(session):
+    # Only once the new rows are committed, so a concurrent reader cannot re-cache the old list
+    if session.info.pop('taxonomy_changed', False):
+        taxonomy_cache.clear(hold=app.config['REPLICA_STICKY_SECONDS'] if app.config['SQLALCHEMY_BINDS'] else 0)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_taxonomy_change(session):
+    session.info.pop('taxonomy_changed', None)
@@ -0,0 +1,52 @@
+import click
+from server.search import rebuild_index
+from server.documents import rebuild_documents
+from server.importer import import_djs, format_for, READERS, IMPORT_CHUNK_SIZE
+from server.passwords import calibrate
+
+
+def register_commands(app):
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index():
+        """Re-index every DJ in the dj_search full-text index."""
+        total = rebuild_index()
+        click.echo(f'Indexed {total} DJs.')
+
+    @app.cli.command('rebuild-dj-documents')
+    def rebuild_dj_documents():
+        """Re-serialize every DJ into the dj_documents read model."""
+        total = rebuild_documents()
+        click.echo(f'Rebuilt {total} DJ documents.')
+
+    @app.cli.command('import-djs')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'file_format', type=click.Choice(sorted(READERS)), help='Defaults to the file extension.')
+    @click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True, help='Rows per transaction.')
+    def import_djs_command(path, file_format, chunk_size):
+        """Bulk import DJs from an NDJSON or CSV file."""
+        file_format = file_format or format_for(path)
+        if file_format not in READERS:
+            raise click.UsageError('Cannot tell the format from the file name, pass --format.')
+
+        with open(path, newline='', encoding='utf-8') as stream:
+            report = import_djs(READERS[file_format](stream), max(1, chunk_size))
+
+        for error in report['errors']:
+            click.echo(f"Row {error['row']}: {error['error']}", err=True)
+        click.echo(
+            f"Imported {report['inserted']} of {report['rows']} rows ({report['failed']} failed) "
+            f"in {report['seconds']}s, {report['rows_per_sec']} rows/sec."
+        )
+
+    @app.cli.command('calibrate-bcrypt')
+    @click.option('--target-ms', type=int, default=app.config['BCRYPT_TARGET_MS'], show_default=True,
+                  help='Longest acceptable time to hash one password.')
+    def calibrate_bcrypt(target_ms):
+        """Pick the bcrypt cost (BCRYPT_LOG_ROUNDS) that hashes within the target time on this host."""
+        log_rounds, timings = calibrate(target_ms)
+        for rounds, ms in timings.items():
+            click.echo(f'cost {rounds}: {ms:.0f} ms')
+        if timings[log_rounds] > target_ms:
+            click.echo(f'Even the minimum cost takes longer than {target_ms} ms; using it anyway.', err=True)
+        click.echo(f"Set BCRYPT_LOG_ROUNDS={log_rounds} (currently {app.config['BCRYPT_LOG_ROUNDS']}). "
+                   'Existing passwords are rehashed at the new cost on their next successful login.')
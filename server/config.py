@@ -5,6 +5,7 @@ from flask_migrate import Migrate
 from flask_restful import Api
 from flask_cors import CORS
 from flask_bcrypt import Bcrypt
+from server.routing import RoutingSession, replica_binds
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -12,10 +13,41 @@ app = Flask(__name__)
 # Load configuration from environment variables or use defaults
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///data.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_BINDS'] = replica_binds(os.getenv('SQLALCHEMY_REPLICA_URIS', ''))  # Comma-separated read replica URIs
+app.config['REPLICA_STICKY_SECONDS'] = float(os.getenv('REPLICA_STICKY_SECONDS', 5))  # After writing, a client reads from the primary this long
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),  # Replace connections the server has dropped
+    'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),  # Seconds before a pooled connection is reopened
+}
+# Pool sizing only applies to QueuePool (not in-memory SQLite), so it is passed only when set
+for option, variable in (('pool_size', 'DB_POOL_SIZE'), ('max_overflow', 'DB_MAX_OVERFLOW'), ('pool_timeout', 'DB_POOL_TIMEOUT')):
+    if os.getenv(variable):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'][option] = int(os.getenv(variable))
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your_default_secret_key_here')  # Replace with a more secure default
+app.config['TAXONOMY_CACHE_TTL'] = float(os.getenv('TAXONOMY_CACHE_TTL', 60))  # Seconds a cached genre/subgenre/venue list stays valid
+app.config['TAXONOMY_CACHE_SIZE'] = int(os.getenv('TAXONOMY_CACHE_SIZE', 256))  # Max cached genre/subgenre/venue lists
+app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1)))  # bcrypt worker threads
+app.config['PASSWORD_HASH_QUEUE_DEPTH'] = int(os.getenv('PASSWORD_HASH_QUEUE_DEPTH', 16))  # Hashes allowed to wait for a worker
+app.config['PASSWORD_HASH_TIMEOUT'] = float(os.getenv('PASSWORD_HASH_TIMEOUT', 5))  # Seconds a request waits before a 503
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))  # bcrypt cost; pick one with `flask calibrate-bcrypt`
+app.config['BCRYPT_TARGET_MS'] = int(os.getenv('BCRYPT_TARGET_MS', 250))  # Hash time calibrate-bcrypt aims for
+app.config['IDENTITY_CACHE_TTL'] = float(os.getenv('IDENTITY_CACHE_TTL', 30))  # Seconds a cached (id, username, is_admin) stays valid
+app.config['IDENTITY_CACHE_SIZE'] = int(os.getenv('IDENTITY_CACHE_SIZE', 10000))  # Max cached identities per worker
+app.config['MEDIA_ROOT'] = os.getenv('MEDIA_ROOT', os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'client', 'public')))  # Holds user-profiles/ and dj-profiles/
+app.config['MEDIA_ACCEL_REDIRECT'] = os.getenv('MEDIA_ACCEL_REDIRECT')  # nginx internal location mapped to MEDIA_ROOT, e.g. /_media
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')  # Let Apache / lighttpd send image files
+app.config['MEDIA_WORKERS'] = int(os.getenv('MEDIA_WORKERS', 2))  # Threads that resize uploads and remove released images
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 32 * 1024 * 1024))  # Any request body, enforced while it streams in
+app.config['MAX_IMAGE_UPLOAD_BYTES'] = int(os.getenv('MAX_IMAGE_UPLOAD_BYTES', 5 * 1024 * 1024))  # A single profile image
+app.config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')  # WAL lets readers run while a write commits
+app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # NORMAL is durable enough under WAL and skips most fsyncs
+app.config['SQLITE_CACHE_SIZE'] = int(os.getenv('SQLITE_CACHE_SIZE', -64000))  # Page cache per connection; negative means KiB
+app.config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # Bytes of the database file read through mmap
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))  # How long a writer waits for the lock before failing
+app.config['SQLITE_SERIALIZE_WRITES'] = os.getenv('SQLITE_SERIALIZE_WRITES', 'true').lower() in ('1', 'true', 'yes')  # Queue this process's writers on one lock
 
 # Initialize extensions
-db = SQLAlchemy(app)  # Database integration
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})  # Database integration; reads of read_only resources may go to replicas
 migrate = Migrate(app, db)
 api = Api(app)  # Flask-RESTful
 
@@ -0,0 +1,102 @@
+from itertools import islice
+from flask import current_app
+from sqlalchemy import delete, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import selectinload
+from .config import db
+from .models.dj import CATALOG_BATCH_SIZE, Dj, DjDocument
+from .responses import STREAM_CHUNK_SIZE
+from .upserts import upsert
+
+
+def dj_document(dj):
+    # Serialized exactly as the catalog endpoints used to serialize each DJ
+    return current_app.json.dumps(dj.to_detailed_dict())
+
+
+def store_documents(djs):
+    # Rewrite the stored document of each DJ; call inside the writing transaction, after a flush
+    values = [{'dj_id': dj.id, 'document': dj_document(dj)} for dj in djs]
+    if not values:
+        return
+    statement = upsert(DjDocument)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['dj_id'], set_={'document': statement.excluded.document}
+    ), values)
+
+
+def refresh_documents(dj_ids):
+    # For writers that insert DJs with Core statements and have no ORM objects to hand
+    for start in range(0, len(dj_ids), CATALOG_BATCH_SIZE):
+        chunk = dj_ids[start:start + CATALOG_BATCH_SIZE]
+        store_documents(Dj.catalog_query(loader=selectinload).filter(Dj.id.in_(chunk)).all())
+
+
+def remove_documents(dj_ids):
+    if dj_ids:
+        db.session.execute(delete(DjDocument).where(DjDocument.dj_id.in_(dj_ids)))
+
+
+def build_documents(dj_ids):
+    # dj_id -> document for DJs whose document isn't stored yet, e.g. before a backfill
+    djs = Dj.catalog_query(loader=selectinload).filter(Dj.id.in_(dj_ids))
+    return {dj.id: dj_document(dj) for dj in djs}
+
+
+def _can_store_built():
+    # In SQLite's rollback journal modes the open read (e.g. a streamed catalog) would block the write until busy_timeout
+    return db.engine.dialect.name != 'sqlite' or current_app.config['SQLITE_JOURNAL_MODE'].upper() == 'WAL'
+
+
+def store_built_documents(built):
+    # Keep documents a read had to build, on a primary connection of their own; DO NOTHING,
+    # so a writer's own document, which may be newer than what the read saw, always wins
+    if not built or not _can_store_built():
+        return
+    statement = upsert(DjDocument).on_conflict_do_nothing(index_elements=['dj_id'])
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(statement, [{'dj_id': dj_id, 'document': document} for dj_id, document in built.items()])
+    except SQLAlchemyError:
+        current_app.logger.warning('Could not store %d built DJ documents', len(built), exc_info=True)
+
+
+def complete_documents(rows):
+    # Document of each (dj_id, document) row in order, building and storing missing ones;
+    # rows is read STREAM_CHUNK_SIZE at a time, so it may be a streamed result
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, STREAM_CHUNK_SIZE))
+        if not chunk:
+            return
+        missing = [dj_id for dj_id, document in chunk if document is None]
+        built = build_documents(missing) if missing else {}
+        store_built_documents(built)
+        for dj_id, document in chunk:
+            if document is None:
+                document = built.get(dj_id)
+            if document is not None:
+                yield document
+
+
+def document_rows(*criteria):
+    # Select of (dj_id, document) for every DJ matching criteria; document is None if not stored yet
+    return select(Dj.id, DjDocument.document).outerjoin(DjDocument, DjDocument.dj_id == Dj.id).where(*criteria)
+
+
+def documents_in_order(dj_ids):
+    # Documents of dj_ids, a chunk at a time, in the order given; ids of missing DJs are skipped
+    for start in range(0, len(dj_ids), STREAM_CHUNK_SIZE):
+        chunk = dj_ids[start:start + STREAM_CHUNK_SIZE]
+        stored = dict(db.session.execute(document_rows(Dj.id.in_(chunk))).all())
+        yield from complete_documents((dj_id, stored[dj_id]) for dj_id in chunk if dj_id in stored)
+
+
+def rebuild_documents():
+    db.session.execute(delete(DjDocument))
+    total = 0
+    for djs in Dj.catalog_batches():
+        store_documents(djs)
+        total += len(djs)
+    db.session.commit()
+    return total
@@ -0,0 +1,54 @@
+from sqlalchemy import func, literal, select, union_all, case
+from .config import db
+from .models.dj import Dj, Genre, Subgenre, Venue, DjGenre, DjSubgenre, DjVenue, genre_key, normalize_key
+
+FACETS = ('genre', 'subgenre', 'venue', 'city', 'produces')
+
+
+def facet_criteria(genres=None, subgenres=None, venues=None, cities=None, produces=None):
+    # Filters on Dj for the requested facet values: OR within a facet, AND across facets,
+    # each a semi-join over its association table so no DJ row repeats
+    criteria = []
+    if genres:
+        criteria.append(Dj.id.in_(
+            select(DjGenre.dj_id).join(Genre, Genre.id == DjGenre.genre_id)
+            .where(Genre.title_key.in_([genre_key(genre) for genre in genres]))
+        ))
+    if subgenres:
+        criteria.append(Dj.id.in_(
+            select(DjSubgenre.dj_id).join(Subgenre, Subgenre.id == DjSubgenre.subgenre_id)
+            .where(Subgenre.subtitle_key.in_([genre_key(subgenre) for subgenre in subgenres]))
+        ))
+    if venues:
+        criteria.append(Dj.id.in_(
+            select(DjVenue.dj_id).join(Venue, Venue.id == DjVenue.venue_id)
+            .where(Venue.venuename_key.in_([normalize_key(venue) for venue in venues]))
+        ))
+    if cities:
+        criteria.append(Dj.city_key.in_([normalize_key(city) for city in cities]))
+    if produces is not None:
+        criteria.append(Dj.produces == produces)
+    return criteria
+
+
+def facet_counts(dj_ids):
+    # {facet: [{'value': ..., 'count': ...}]} over the ids selected by dj_ids, most common first,
+    # in a single UNION ALL aggregate
+    produces = case((Dj.produces, 'true'), else_='false')
+    query = union_all(
+        select(literal('genre').label('facet'), Genre.title.label('value'), func.count(func.distinct(DjGenre.dj_id)).label('count'))
+        .join(Genre, Genre.id == DjGenre.genre_id).where(DjGenre.dj_id.in_(dj_ids)).group_by(Genre.title),
+        select(literal('subgenre'), Subgenre.subtitle, func.count(func.distinct(DjSubgenre.dj_id)))
+        .join(Subgenre, Subgenre.id == DjSubgenre.subgenre_id).where(DjSubgenre.dj_id.in_(dj_ids)).group_by(Subgenre.subtitle),
+        select(literal('venue'), Venue.venuename, func.count(func.distinct(DjVenue.dj_id)))
+        .join(Venue, Venue.id == DjVenue.venue_id).where(DjVenue.dj_id.in_(dj_ids)).group_by(Venue.venuename),
+        select(literal('city'), Dj.city, func.count(Dj.id)).where(Dj.id.in_(dj_ids)).group_by(Dj.city),
+        select(literal('produces'), produces, func.count(Dj.id)).where(Dj.id.in_(dj_ids)).group_by(produces),
+    )
+
+    counts = {facet: [] for facet in FACETS}
+    for row in db.session.execute(query):
+        counts[row.facet].append({'value': row.value, 'count': row.count})
+    for values in counts.values():
+        values.sort(key=lambda item: (-item['count'], item['value']))
+    return counts
@@ -0,0 +1,38 @@
+from sqlalchemy import delete, exists, literal, select
+from .config import db
+from .models.dj import Dj
+from .models.user import User, user_dj_favourites
+from .upserts import upsert
+
+MAX_BULK_FAVOURITES = 5000
+
+
+def user_exists(user_id):
+    return db.session.execute(select(User.id).where(User.id == user_id)).first() is not None
+
+
+def existing_dj_ids(dj_ids):
+    if not dj_ids:
+        return set()
+    return set(db.session.execute(select(Dj.id).where(Dj.id.in_(dj_ids))).scalars())
+
+
+def add_favourites(user_id, dj_ids):
+    # One INSERT .. SELECT: missing DJs, and a user deleted since their identity was cached, add nothing.
+    # Returns how many rows were added
+    if not dj_ids:
+        return 0
+    # ON CONFLICT DO NOTHING against the (user_id, dj_id) unique index
+    statement = upsert(user_dj_favourites).from_select(
+        ['user_id', 'dj_id'], select(literal(user_id), Dj.id).where(Dj.id.in_(dj_ids), exists().where(User.id == user_id))
+    ).on_conflict_do_nothing(index_elements=['user_id', 'dj_id'])
+    return db.session.execute(statement).rowcount
+
+
+def remove_favourites(user_id, dj_ids):
+    # Unfavourite every DJ in dj_ids; returns how many rows were removed
+    if not dj_ids:
+        return 0
+    return db.session.execute(delete(user_dj_favourites).where(
+        user_dj_favourites.c.user_id == user_id, user_dj_favourites.c.dj_id.in_(dj_ids)
+    )).rowcount
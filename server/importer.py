@@ -0,0 +1,246 @@
+import csv
+import json
+import os
+import time
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from .config import db
+from .models.dj import Dj, DjDocument, DjGenre, DjSubgenre, DjVenue, canonical_genre_title, first_by_key, genre_key, normalize_key
+from .models.user import user_dj_favourites
+from .search import search_backend
+from .documents import refresh_documents
+from .versioning import bump_versions
+from .taxonomy import genre_ids, subgenre_ids, venue_ids
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+class RowError(ValueError):
+    pass
+
+
+def delete_all_djs():
+    # Every DJ and the rows that point at it: stored documents, search entries, associations and favourites.
+    # The catalog version moves in the same transaction, so no client keeps a 304 for the old catalog
+    db.session.execute(delete(DjDocument))
+    search_backend().clear()
+    for table in (DjGenre, DjSubgenre, DjVenue, user_dj_favourites):
+        db.session.execute(delete(table))
+    db.session.execute(delete(Dj))
+    bump_versions()
+
+
+def read_ndjson(stream):
+    # One JSON object per line, with the same fields AddDj accepts
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, RowError(f'Invalid JSON: {e}')
+
+
+def read_csv(stream):
+    # Header row of name, produces, city, genres, subgenres, venues; list cells are ';'-separated
+    # and subgenres are written 'House: Deep House | Acid House; Techno: Minimal'
+    reader = csv.DictReader(stream)
+    for record in reader:
+        subgenres = {}
+        for part in _split(record.get('subgenres'), ';'):
+            genre, _, titles = part.partition(':')
+            subgenres[genre.strip()] = _split(titles, '|')
+        yield reader.line_num, {
+            'name': record.get('name'),
+            'produces': record.get('produces'),
+            'city': record.get('city'),
+            'genres': _split(record.get('genres'), ';'),
+            'subgenres': subgenres,
+            'venues': _split(record.get('venues'), ';'),
+        }
+
+
+READERS = {
+    'ndjson': read_ndjson,
+    'csv': read_csv,
+}
+
+
+def format_for(filename):
+    extension = os.path.splitext(filename or '')[1].lower()
+    return {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}.get(extension)
+
+
+def _split(value, separator):
+    return [part.strip() for part in (value or '').split(separator) if part.strip()]
+
+
+def _text(record, field):
+    value = record.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise RowError(f'{field} is required')
+    return value.strip()
+
+
+def _titles(record, field):
+    value = record.get(field) or []
+    if not isinstance(value, list) or not all(isinstance(title, str) for title in value):
+        raise RowError(f'{field} must be a list of names')
+    return [title for title in value if title.strip()]
+
+
+def _produces(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ('true', 'yes', '1'):
+        return True
+    if isinstance(value, str) and value.strip().lower() in ('false', 'no', '0'):
+        return False
+    raise RowError('produces must be true or false')
+
+
+def clean_row(record):
+    # Validate one record and normalize its names the way AddDj does
+    if isinstance(record, RowError):
+        raise record
+    if not isinstance(record, dict):
+        raise RowError('Expected an object')
+
+    genres = list(first_by_key((canonical_genre_title(title) for title in _titles(record, 'genres')), genre_key).values())
+    if not genres:
+        raise RowError('genres are required')
+    venues = list(first_by_key(title.strip().title() for title in _titles(record, 'venues')).values())
+    if not venues:
+        raise RowError('venues are required')
+
+    subgenres = record.get('subgenres') or {}
+    if not isinstance(subgenres, dict):
+        raise RowError('subgenres must map genres to lists of subgenres')
+    subgenres_by_genre = {}
+    for genre, titles in subgenres.items():
+        if not isinstance(titles, list) or not all(isinstance(title, str) for title in titles):
+            raise RowError('subgenres must map genres to lists of subgenres')
+        subgenres_by_genre.setdefault(canonical_genre_title(genre), []).extend(titles)
+
+    return {
+        'name': _text(record, 'name'),
+        'produces': _produces(record.get('produces')),
+        'city': _text(record, 'city'),
+        'genres': genres,
+        # As in AddDj, only subgenres of the DJ's own genres are kept
+        'subgenres': {
+            genre: list(first_by_key((canonical_genre_title(title) for title in subgenres_by_genre.get(genre, []) if title.strip()), genre_key).values())
+            for genre in genres
+        },
+        'venues': venues,
+    }
+
+
+def _import_chunk(rows):
+    # Insert one chunk of cleaned (number, row) pairs; returns [(number, error)] for rows skipped as duplicates
+    skipped, fresh, seen = [], [], set()
+    for _, row in rows:
+        row['name_key'], row['city_key'] = normalize_key(row['name']), normalize_key(row['city'])
+    existing = set(db.session.execute(
+        select(Dj.name_key, Dj.city_key).where(Dj.name_key.in_({row['name_key'] for _, row in rows}))
+    ).all())
+    for number, row in rows:
+        key = (row['name_key'], row['city_key'])
+        if key in existing or key in seen:
+            skipped.append((number, f"{row['name']} already exists in the database for city {row['city']}"))
+            continue
+        seen.add(key)
+        fresh.append(row)
+    if not fresh:
+        return skipped
+
+    genre_id_by_key = genre_ids((), create={genre for row in fresh for genre in row['genres']})
+    subgenre_id_by_key = subgenre_ids({
+        (genre_id_by_key[genre_key(genre)], subtitle)
+        for row in fresh for genre, subtitles in row['subgenres'].items() for subtitle in subtitles
+    })
+    venue_id_by_key = venue_ids({venue for row in fresh for venue in row['venues']})
+
+    dj_ids = db.session.execute(
+        insert(Dj).returning(Dj.id, sort_by_parameter_order=True),
+        [{'name': row['name'], 'name_key': row['name_key'], 'produces': row['produces'], 'city': row['city'],
+          'city_key': row['city_key'], 'dj_profile_picture': None} for row in fresh],
+    ).scalars().all()
+
+    dj_genres, dj_subgenres, dj_venues, documents = [], [], [], []
+    for dj_id, row in zip(dj_ids, fresh):
+        dj_genres += [{'dj_id': dj_id, 'genre_id': genre_id_by_key[genre_key(genre)]} for genre in row['genres']]
+        dj_subgenres += [
+            {'dj_id': dj_id, 'subgenre_id': subgenre_id_by_key[(genre_id_by_key[genre_key(genre)], genre_key(subtitle))]}
+            for genre, subtitles in row['subgenres'].items() for subtitle in subtitles
+        ]
+        dj_venues += [{'dj_id': dj_id, 'venue_id': venue_id_by_key[normalize_key(venue)]} for venue in row['venues']]
+        documents.append({
+            'dj_id': dj_id,
+            'name': row['name'],
+            'city': row['city'],
+            'genres': ' '.join(row['genres']),
+            'subgenres': ' '.join(subtitle for subtitles in row['subgenres'].values() for subtitle in subtitles),
+            'venues': ' '.join(row['venues']),
+        })
+
+    for model, values in ((DjGenre, dj_genres), (DjSubgenre, dj_subgenres), (DjVenue, dj_venues)):
+        if values:
+            db.session.execute(insert(model), values)
+    search_backend().index(documents)
+    refresh_documents(dj_ids)
+    # Last, so the catalog version row stays locked only until the chunk commits
+    version = bump_versions()
+    db.session.execute(update(Dj).where(Dj.id.in_(dj_ids)).values(version=version))
+    return skipped
+
+
+def _commit_chunk(chunk, report):
+    try:
+        skipped = _import_chunk(chunk)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        if len(chunk) == 1:
+            _fail(report, chunk[0][0], f'Database error: {getattr(e, "orig", e)}')
+            return
+        # Retry row by row so one bad row cannot sink the rest of its chunk
+        for row in chunk:
+            _commit_chunk([row], report)
+        return
+
+    for number, message in skipped:
+        _fail(report, number, message)
+    report['inserted'] += len(chunk) - len(skipped)
+
+
+def _fail(report, number, message):
+    report['failed'] += 1
+    if len(report['errors']) < MAX_REPORTED_ERRORS:
+        report['errors'].append({'row': number, 'error': message})
+
+
+def import_djs(records, chunk_size=IMPORT_CHUNK_SIZE):
+    # Bulk insert (row number, record) pairs, committing every chunk_size rows; invalid or
+    # duplicate rows are reported, not raised
+    started = time.perf_counter()
+    report = {'rows': 0, 'inserted': 0, 'failed': 0, 'errors': []}
+
+    chunk = []
+    for number, record in records:
+        report['rows'] += 1
+        try:
+            chunk.append((number, clean_row(record)))
+        except RowError as e:
+            _fail(report, number, str(e))
+        if len(chunk) >= chunk_size:
+            _commit_chunk(chunk, report)
+            chunk = []
+    if chunk:
+        _commit_chunk(chunk, report)
+
+    elapsed = time.perf_counter() - started
+    report['seconds'] = round(elapsed, 3)
+    report['rows_per_sec'] = round(report['inserted'] / elapsed, 1) if elapsed else None
+    return report
@@ -0,0 +1,289 @@
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from flask import abort, request, send_from_directory
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.security import safe_join
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from .config import app, db
+from .models.media import MediaFile
+from .upserts import upsert
+from .sqlite_profile import begin_write
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow no variants are made and the original is served in their place
+    Image = None
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Room for multipart boundaries and headers on top of the image itself
+MULTIPART_ALLOWANCE = 16 * 1024
+# Leading bytes of each accepted format -> stored extension
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+# Content-addressed files never change, so clients may keep them for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# Longest edge in pixels of each resized copy made in the background
+IMAGE_VARIANTS = {'thumb': 128, 'medium': 512}
+CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}(-(?:%s))?\.[a-z0-9]+$' % '|'.join(IMAGE_VARIANTS))
+VARIANT_NAME = re.compile(r'^([0-9a-f]{64})-(?:%s)\.([a-z0-9]+)$' % '|'.join(IMAGE_VARIANTS))
+
+
+def media_dir(kind):
+    return os.path.join(app.config['MEDIA_ROOT'], kind)
+
+
+def is_content_addressed(filename):
+    return bool(CONTENT_ADDRESSED.match(filename))
+
+
+def variant_name(filename, variant):
+    # Only content-addressed uploads get variants; older files stand in for their own
+    if not is_content_addressed(filename):
+        return filename
+    digest, extension = filename.rsplit('.', 1)
+    return f'{digest}-{variant}.{extension}'
+
+
+def variant_urls(kind, filename):
+    if not filename:
+        return None
+    return {variant: f'/{kind}/{variant_name(filename, variant)}' for variant in IMAGE_VARIANTS}
+
+
+def cache_policy(response, filename):
+    # A content-addressed name changes whenever the bytes do, so it can be cached for good;
+    # older timestamped names are revalidated against their ETag / Last-Modified instead
+    if is_content_addressed(filename):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def send_media(kind, filename):
+    # Keep the file's bytes out of Python: X-Accel-Redirect for nginx, X-Sendfile with USE_X_SENDFILE,
+    # otherwise wsgi.file_wrapper, which servers such as gunicorn turn into sendfile(2)
+    match = VARIANT_NAME.match(filename)
+    if match and not os.path.exists(os.path.join(media_dir(kind), filename)):
+        # Variant not made yet: send the original, revalidated rather than cached for good
+        original = f'{match.group(1)}.{match.group(2)}'
+        response = send_from_directory(media_dir(kind), original)
+        response.cache_control.no_cache = True
+        return response
+
+    accel_prefix = app.config['MEDIA_ACCEL_REDIRECT']
+    if accel_prefix:
+        path = safe_join(kind, filename)
+        if path is None:
+            abort(404)
+        response = app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{path}"
+        return cache_policy(response, filename)
+
+    return cache_policy(send_from_directory(media_dir(kind), filename), filename)
+
+
+class UploadRejected(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def too_large():
+    limit = app.config['MAX_IMAGE_UPLOAD_BYTES']
+    return UploadRejected(f'Images must be {limit / (1024 * 1024):g} MB or smaller.', 413)
+
+
+def sniff_image(head):
+    # The real format, whatever the file is called
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+
+def uploaded_image(field='profileImage'):
+    # The upload in request.files[field]; a body declared too big is refused before any of it is read
+    if (request.content_length or 0) > app.config['MAX_IMAGE_UPLOAD_BYTES'] + MULTIPART_ALLOWANCE:
+        raise too_large()
+    try:
+        files = request.files
+    except RequestEntityTooLarge:
+        raise too_large() from None
+    if field not in files:
+        raise UploadRejected('No image provided.')
+    upload = files[field]
+    if upload.filename == '':
+        raise UploadRejected('No selected file.')
+    return upload
+
+
+def store_upload(kind, upload):
+    # Stream the upload to a temp file, take a reference to <sha256>.<sniffed format>, then rename it into
+    # place; call inside the transaction that records the returned filename
+    limit = app.config['MAX_IMAGE_UPLOAD_BYTES']
+    head = upload.stream.read(UPLOAD_CHUNK_SIZE)
+    extension = sniff_image(head)
+    if extension is None:
+        raise UploadRejected('Unsupported file type.')
+
+    directory = media_dir(kind)
+    os.makedirs(directory, exist_ok=True)
+    digest, size = hashlib.sha256(), 0
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+    try:
+        with os.fdopen(descriptor, 'wb') as temp:
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > limit:
+                    raise too_large()
+                digest.update(chunk)
+                temp.write(chunk)
+                chunk = upload.stream.read(UPLOAD_CHUNK_SIZE)
+        filename = f'{digest.hexdigest()}.{extension}'
+        # The reference comes first: while a removal of the same file holds its row, this waits for
+        # it, so the copy renamed into place below is never the one being removed
+        db.session.execute(upsert(MediaFile).values(kind=kind, filename=filename, refcount=1).on_conflict_do_update(
+            index_elements=['kind', 'filename'], set_={'refcount': MediaFile.refcount + 1}
+        ))
+        # If the transaction rolls back, the file may have no owner
+        db.session.info.setdefault('media_to_check', set()).add((kind, filename))
+        db.session.info.setdefault('media_uploaded', set()).add((kind, filename))
+        # Same name means same bytes, so replacing an existing copy is harmless
+        os.replace(temp_path, os.path.join(directory, filename))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return filename
+
+
+def lock_owner(model, owner_id):
+    # Re-read the row holding a media reference, locked until commit, so two requests can't both release
+    # or replace the same reference (SQLite holds this process's writer lock instead); None if it's gone
+    begin_write(db.session)
+    return db.session.execute(
+        select(model).where(model.id == owner_id).with_for_update().execution_options(populate_existing=True)
+    ).scalar()
+
+
+def release(kind, filename):
+    # Drop one reference to a stored image; the file is removed after commit once nobody uses it
+    db.session.execute(update(MediaFile).where(
+        MediaFile.kind == kind, MediaFile.filename == filename
+    ).values(refcount=MediaFile.refcount - 1))
+    db.session.info.setdefault('media_to_check', set()).add((kind, filename))
+
+
+# Resizing and file removal run here, after the request that caused them has committed
+media_workers = ThreadPoolExecutor(max_workers=app.config['MEDIA_WORKERS'], thread_name_prefix='media')
+
+
+def _in_background(function, *args):
+    def run():
+        with app.app_context():
+            try:
+                function(*args)
+            except Exception:
+                app.logger.exception('Background media job %s failed', function.__name__)
+    media_workers.submit(run)
+
+
+def _write_atomically(directory, filename, write):
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.variant-')
+    try:
+        with os.fdopen(descriptor, 'wb') as temp:
+            write(temp)
+        os.replace(temp_path, os.path.join(directory, filename))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def make_variants(kind, filename):
+    # Write every missing IMAGE_VARIANTS copy of a stored upload next to it
+    if Image is None or not is_content_addressed(filename):
+        return
+    directory = media_dir(kind)
+    with Image.open(os.path.join(directory, filename)) as original:
+        image_format = original.format
+        for variant, size in IMAGE_VARIANTS.items():
+            name = variant_name(filename, variant)
+            if os.path.exists(os.path.join(directory, name)):
+                continue
+            resized = original.copy()
+            resized.thumbnail((size, size))
+            if image_format == 'JPEG' and resized.mode not in ('RGB', 'L'):
+                resized = resized.convert('RGB')
+            _write_atomically(directory, name, lambda temp: resized.save(temp, format=image_format))
+
+
+def _move_aside(kind, filename, moved):
+    # Rename the file and its variants out of the way, recording (path, aside) pairs in moved
+    for name in {filename, *(variant_name(filename, variant) for variant in IMAGE_VARIANTS)}:
+        path = os.path.join(media_dir(kind), name)
+        if os.path.exists(path):
+            aside = os.path.join(media_dir(kind), f'.removing-{name}')
+            os.replace(path, aside)
+            moved.append((path, aside))
+
+
+def _remove_unreferenced(files, rolled_back_uploads=()):
+    # On connections of its own after the transaction ended. The guarded DELETE is the only check.
+    # The files are moved aside while the deleted row is still locked, so an upload of the same image
+    # waits and then writes a fresh copy, and are only unlinked once the DELETE has committed
+    for kind, filename in files:
+        moved = []
+        try:
+            with db.engine.begin() as connection:
+                if (kind, filename) in rolled_back_uploads:
+                    # A new upload that rolled back never committed a row; claim one with no references
+                    # (waiting out any upload of the same image in progress) so the DELETE can match it
+                    connection.execute(upsert(MediaFile).values(kind=kind, filename=filename, refcount=0).on_conflict_do_nothing(
+                        index_elements=['kind', 'filename']
+                    ))
+                deleted = connection.execute(MediaFile.__table__.delete().where(
+                    MediaFile.kind == kind, MediaFile.filename == filename, MediaFile.refcount <= 0
+                )).rowcount
+                if deleted == 1:
+                    _move_aside(kind, filename, moved)
+        except BaseException:
+            # The row is still there, so its files must be too
+            for path, aside in moved:
+                os.replace(aside, path)
+            raise
+        for _, aside in moved:
+            os.remove(aside)
+
+
+@event.listens_for(Session, 'after_commit')
+def _process_committed_media(session):
+    for kind, filename in session.info.pop('media_uploaded', ()):
+        _in_background(make_variants, kind, filename)
+    files = session.info.pop('media_to_check', None)
+    if files:
+        _in_background(_remove_unreferenced, files)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _collect_orphaned_media(session, previous_transaction):
+    # Only the outermost rollback; uploads written for the rolled-back transaction may be orphans
+    if previous_transaction.parent is None:
+        uploaded = session.info.pop('media_uploaded', set())
+        files = session.info.pop('media_to_check', None)
+        if files:
+            _in_background(_remove_unreferenced, files, uploaded)
@@ -1,14 +1,49 @@
 from server.config import db, bcrypt
 from sqlalchemy_serializer import SerializerMixin
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, UniqueConstraint, Index, Text
+from sqlalchemy.orm import relationship, subqueryload, validates
 from sqlalchemy.ext.associationproxy import association_proxy
 from .user import user_dj_favourites
+from server.media import variant_urls
 
 
 # Base = declarative_base()
 
+# DJs loaded per query when walking the whole catalog
+CATALOG_BATCH_SIZE = 500
+
+# Alternative spellings folded onto one canonical genre title
+GENRE_ALIASES = {
+    "drum n bass": "Drum & Bass",
+    "dnb": "Drum & Bass",
+    "d&b": "Drum & Bass",
+    "drum and bass": "Drum & Bass",
+    "d & b": "Drum & Bass",
+    "d n b": "Drum & Bass",
+    "dubstep": "Dubstep",
+    "140": "Dubstep",
+}
+
+def normalize_key(value):
+    # Lookup key stored next to a name: whitespace collapsed and case folded
+    return ' '.join(value.split()).casefold()
+
+def genre_key(title):
+    # Aliases share the key of the title they fold onto, so 'DnB' finds 'Drum & Bass'
+    key = normalize_key(title)
+    return normalize_key(GENRE_ALIASES.get(key, key))
+
+def canonical_genre_title(title):
+    return GENRE_ALIASES.get(normalize_key(title), title.strip().title())
+
+def first_by_key(names, to_key=normalize_key):
+    # Lookup key -> the first spelling of each name with a distinct key
+    keyed = {}
+    for name in names:
+        keyed.setdefault(to_key(name), name)
+    return keyed
+
 class Dj(db.Model, SerializerMixin):
     __tablename__ = "djs"
 
@@ -17,8 +52,15 @@ class Dj(db.Model, SerializerMixin):
     produces = Column(Boolean(), nullable=False)
     dj_profile_picture = Column(String(), nullable=True)
     city = Column(String(), nullable=False)
+    version = Column(Integer(), nullable=False, default=1, server_default='1')  # Catalog version of the last write to this DJ
+    name_key = Column(String(), nullable=False)
+    city_key = Column(String(), nullable=False)
 
-    __table_args__ = (UniqueConstraint('name', 'city', name='unique_dj_per_city'),)
+    __table_args__ = (
+        UniqueConstraint('name', 'city', name='unique_dj_per_city'),
+        Index('ix_djs_name_id', 'name', 'id'),  # Serves ORDER BY name, id and keyset pagination
+        Index('ix_djs_name_key_city_key', 'name_key', 'city_key', unique=True),
+    )
 
     dj_genres = relationship("DjGenre", back_populates="dj")
     genres = association_proxy("dj_genres", "genre", creator=lambda g: DjGenre(genre=g))
@@ -32,6 +74,41 @@ class Dj(db.Model, SerializerMixin):
     def __repr__(self):
         return f"{self.name}"
 
+    @validates('name')
+    def _set_name_key(self, key, name):
+        self.name_key = normalize_key(name)
+        return name
+
+    @validates('city')
+    def _set_city_key(self, key, city):
+        self.city_key = normalize_key(city)
+        return city
+
+    @classmethod
+    def catalog_options(cls, loader=subqueryload):
+        # Everything to_detailed_dict() and serialize_favourites() touch, loaded
+        # with one extra query per relationship chain instead of one per row
+        return (
+            loader(cls.dj_genres).joinedload(DjGenre.genre),
+            loader(cls.dj_subgenres).joinedload(DjSubgenre.subgenre).joinedload(Subgenre.genre),
+            loader(cls.dj_venues).joinedload(DjVenue.venue),
+        )
+
+    @classmethod
+    def catalog_query(cls, loader=subqueryload):
+        return db.session.query(cls).options(*cls.catalog_options(loader))
+
+    @classmethod
+    def catalog_batches(cls, size=CATALOG_BATCH_SIZE):
+        # Every DJ with catalog_options loaded, size at a time in id order
+        last_id = 0
+        while True:
+            djs = cls.catalog_query().filter(cls.id > last_id).order_by(cls.id).limit(size).all()
+            if not djs:
+                return
+            yield djs
+            last_id = djs[-1].id
+
     def to_detailed_dict(self):
         # Collect genres and their subgenres
         genre_subgenre_mapping = {}
@@ -46,6 +123,7 @@ class Dj(db.Model, SerializerMixin):
             'name': self.name,
             'produces': self.produces,
             'dj_profile_picture': self.dj_profile_picture,
+            'dj_profile_picture_variants': variant_urls('dj-profiles', self.dj_profile_picture),
             'city': self.city,
             'genres': list(genre_subgenre_mapping.keys()),  # List of genres
             'subgenres': genre_subgenre_mapping,  # Mapping of genres to their subgenres
@@ -53,11 +131,30 @@ class Dj(db.Model, SerializerMixin):
         }
 
 
+class DjDocument(db.Model):
+    __tablename__ = "dj_documents"
+
+    # Dj.to_detailed_dict() serialized to JSON, rewritten in the same transaction as every write to the DJ
+    dj_id = Column(Integer, ForeignKey('djs.id'), primary_key=True)
+    document = Column(Text, nullable=False)
+
+
+class CatalogVersion(db.Model):
+    __tablename__ = "catalog_version"
+
+    # Single row, bumped by every write to the DJ catalog
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
+
+
 class Genre(db.Model):
     __tablename__ = "genres"
 
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False, unique=True)
+    title_key = Column(String, nullable=False)
+
+    __table_args__ = (Index('ix_genres_title_key', 'title_key', unique=True),)
 
     subgenres = relationship("Subgenre", back_populates="genre")
 
@@ -67,6 +164,11 @@ class Genre(db.Model):
     def __repr__(self):
         return f"{self.title}"
 
+    @validates('title')
+    def _set_title_key(self, key, title):
+        self.title_key = genre_key(title)
+        return title
+
 class DjGenre(db.Model):
     __tablename__ = "dj_genres"
 
@@ -74,6 +176,11 @@ class DjGenre(db.Model):
     dj_id = Column(Integer, ForeignKey('djs.id'))
     genre_id = Column(Integer, ForeignKey('genres.id'))
 
+    __table_args__ = (
+        Index('ix_dj_genres_dj_id_genre_id', 'dj_id', 'genre_id', unique=True),
+        Index('ix_dj_genres_genre_id_dj_id', 'genre_id', 'dj_id'),
+    )
+
     dj = relationship('Dj', back_populates='dj_genres')
     genre = relationship('Genre', back_populates='dj_genres')
 
@@ -82,8 +189,11 @@ class Subgenre(db.Model):
 
     id = Column(Integer, primary_key=True)
     subtitle = Column(String, nullable=False)
+    subtitle_key = Column(String, nullable=False)
     genre_id = Column(Integer, ForeignKey("genres.id"))
 
+    __table_args__ = (Index('ix_subgenres_genre_id_subtitle_key', 'genre_id', 'subtitle_key', unique=True),)
+
     genre = relationship("Genre", back_populates="subgenres")
 
     dj_subgenres = relationship("DjSubgenre", back_populates="subgenre")
@@ -92,6 +202,11 @@ class Subgenre(db.Model):
     def __repr__(self):
         return f"{self.subtitle}"
 
+    @validates('subtitle')
+    def _set_subtitle_key(self, key, subtitle):
+        self.subtitle_key = genre_key(subtitle)
+        return subtitle
+
 class DjSubgenre(db.Model):
     __tablename__ = "dj_subgenres"
 
@@ -99,6 +214,11 @@ class DjSubgenre(db.Model):
     dj_id = Column(Integer, ForeignKey('djs.id'))
     subgenre_id = Column(Integer, ForeignKey('subgenres.id'))
 
+    __table_args__ = (
+        Index('ix_dj_subgenres_dj_id_subgenre_id', 'dj_id', 'subgenre_id', unique=True),
+        Index('ix_dj_subgenres_subgenre_id_dj_id', 'subgenre_id', 'dj_id'),
+    )
+
     dj = relationship('Dj', back_populates='dj_subgenres')
     subgenre = relationship('Subgenre', back_populates='dj_subgenres')
 
@@ -107,6 +227,9 @@ class Venue(db.Model):
 
     id = Column(Integer, primary_key=True)
     venuename = Column(String, nullable=False)
+    venuename_key = Column(String, nullable=False)
+
+    __table_args__ = (Index('ix_venues_venuename_key', 'venuename_key', unique=True),)
 
     dj_venues = relationship("DjVenue", back_populates="venue")
     djs = association_proxy("dj_venues", "dj", creator=lambda dv: DjVenue(dj=dv))
@@ -114,6 +237,11 @@ class Venue(db.Model):
     def __repr__(self):
         return f"{self.venuename}"
 
+    @validates('venuename')
+    def _set_venuename_key(self, key, venuename):
+        self.venuename_key = normalize_key(venuename)
+        return venuename
+
 class DjVenue(db.Model):
     __tablename__ = "dj_venues"
 
@@ -121,5 +249,10 @@ class DjVenue(db.Model):
     dj_id = Column(Integer, ForeignKey('djs.id'))
     venue_id = Column(Integer, ForeignKey('venues.id'))
 
+    __table_args__ = (
+        Index('ix_dj_venues_dj_id_venue_id', 'dj_id', 'venue_id', unique=True),
+        Index('ix_dj_venues_venue_id_dj_id', 'venue_id', 'dj_id'),
+    )
+
     dj = relationship('Dj', back_populates='dj_venues')
     venue = relationship('Venue', back_populates='dj_venues')
@@ -0,0 +1,17 @@
+from server.config import db
+from sqlalchemy import Column, Integer, String, UniqueConstraint
+
+
+class MediaFile(db.Model):
+    __tablename__ = "media_files"
+
+    # One row per stored image file; refcount is how many users / DJs point at it
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    filename = Column(String, nullable=False)
+    refcount = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (UniqueConstraint('kind', 'filename', name='unique_media_file'),)
+
+    def __repr__(self):
+        return f"<MediaFile {self.kind}/{self.filename} x{self.refcount}>"
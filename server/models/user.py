@@ -1,7 +1,9 @@
-from server.config import db, bcrypt
+from server.config import db
+from server.passwords import PasswordHashingBusy, password_hasher
+from server.media import variant_urls
 from sqlalchemy_serializer import SerializerMixin
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, Table
+from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, Index, Table, select
 from sqlalchemy.orm import relationship
 
 # Association table for many-to-many relationship between User and Dj
@@ -9,7 +11,9 @@ user_dj_favourites = Table(
     'user_dj_favourites',
     db.metadata,
     Column('user_id', Integer, ForeignKey('users.id')),
-    Column('dj_id', Integer, ForeignKey('djs.id'))
+    Column('dj_id', Integer, ForeignKey('djs.id')),
+    Index('ix_user_dj_favourites_user_id_dj_id', 'user_id', 'dj_id', unique=True),
+    Index('ix_user_dj_favourites_dj_id_user_id', 'dj_id', 'user_id'),
 )
 
 
@@ -31,28 +35,60 @@ class User(db.Model, SerializerMixin):
     
     @hashed_password.setter
     def hashed_password(self, password):
-        hashed_password = bcrypt.generate_password_hash(password.encode('utf-8'))
-        self._hashed_password = hashed_password.decode('utf-8')
+        # Both run on the shared hashing pool and may raise PasswordHashingBusy
+        self._hashed_password = password_hasher.hash(password)
 
     def authenticate(self, password):
-        return bcrypt.check_password_hash(self._hashed_password, password.encode('utf-8'))
+        if not password_hasher.check(self._hashed_password, password):
+            return False
+        if password_hasher.needs_rehash(self._hashed_password):
+            # Bring the stored hash to the configured cost; saved by the caller's commit
+            try:
+                self.hashed_password = password
+            except PasswordHashingBusy:
+                pass  # Keep the old hash and try again on the next login
+        return True
     
-    def to_dict(self):
-        return {
+    def to_dict(self, expand_favourites=False):
+        # Favourites are listed by id; the full DJs only when asked for (?expand=favourites)
+        data = {
             'id': self.id,
             'username': self.username,
             'is_admin': self.is_admin,
             'profile_image_url': self.profile_image_url, 
-            'favourites': [self.serialize_favourites(dj) for dj in self.favourites] if self.favourites else []
+            'profile_image_variants': variant_urls('user-profiles', self.profile_image_url),
+            'favourite_ids': self.favourite_ids()
         }
+        if expand_favourites:
+            data['favourites'] = [self.serialize_favourites(dj) for dj in self.favourite_djs()]
+        return data
+
+    def favourite_ids(self):
+        # Answered from the (user_id, dj_id) index alone
+        return db.session.execute(
+            select(user_dj_favourites.c.dj_id).where(user_dj_favourites.c.user_id == self.id).order_by(user_dj_favourites.c.dj_id)
+        ).scalars().all()
+
+    def favourites_query(self):
+        # Favourites with their genres, subgenres and venues eager-loaded
+        from .dj import Dj
+        return Dj.catalog_query().join(user_dj_favourites, user_dj_favourites.c.dj_id == Dj.id).filter(
+            user_dj_favourites.c.user_id == self.id
+        )
+
+    def favourite_djs(self):
+        return self.favourites_query().all()
     
     def serialize_favourites(self, dj):
+        subgenres = {}
+        for subgenre in dj.subgenres:
+            subgenres.setdefault(subgenre.genre_id, []).append(subgenre.subtitle)
         return {
             'id': dj.id,
             'name': dj.name,
             'produces': dj.produces,
             'genres': [genre.title for genre in dj.genres],
-            'subgenres': {genre.title: [subgenre.subtitle for subgenre in dj.subgenres if subgenre.genre_id == genre.id] for genre in dj.genres},
+            'subgenres': {genre.title: subgenres.get(genre.id, []) for genre in dj.genres},
             'venues': [venue.venuename for venue in dj.venues]
         }
 
@@ -0,0 +1,82 @@
+import base64
+import json
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def page_size(limit):
+    # Clamp a client supplied limit into 1..MAX_PAGE_SIZE
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(*values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Invalid cursor')
+    return values
+
+
+def _is_a(value, python_type):
+    # JSON true / false decode to bool, which would otherwise pass as an int
+    if isinstance(value, bool):
+        return python_type is bool
+    if python_type is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, python_type)
+
+
+def decode_typed_cursor(cursor, types):
+    # A cursor whose values don't have the given Python types is as invalid as a garbled one
+    values = decode_cursor(cursor, len(types))
+    if not all(_is_a(value, python_type) for value, python_type in zip(values, types)):
+        raise InvalidCursor('Invalid cursor')
+    return values
+
+
+def after(columns, values):
+    # Row-value comparison (a, b, ...) > (x, y, ...) spelled out so every backend can use the index
+    column, value = columns[0], values[0]
+    if len(columns) == 1:
+        return column > value
+    return or_(column > value, and_(column == value, after(columns[1:], values[1:])))
+
+
+def keyset_page(query, columns, limit, cursor=None):
+    # (rows, next_cursor) for the page after cursor; the last column must be unique so the
+    # ordering is total, and every page is one index range scan however deep it starts
+    if cursor:
+        values = decode_typed_cursor(cursor, [column.type.python_type for column in columns])
+        query = query.filter(after(columns, values))
+    rows = query.order_by(*columns).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*[getattr(rows[-1], column.key) for column in columns])
+    return rows, next_cursor
+
+
+def starts_with(column, prefix):
+    # The range [prefix, next prefix) lets a B-tree index on column serve the scan, which SQLite's
+    # case-insensitive LIKE cannot; the LIKE keeps it exact under other collations
+    criteria = [column >= prefix, column.startswith(prefix, autoescape=True)]
+    if ord(prefix[-1]) < 0x10FFFF:
+        criteria.append(column < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+    return criteria
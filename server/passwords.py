@@ -0,0 +1,90 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from flask import make_response
+from .config import app, bcrypt
+
+RETRY_AFTER_SECONDS = 1
+# Calibration never goes below MIN_LOG_ROUNDS, whatever the target
+MIN_LOG_ROUNDS = 10
+MAX_LOG_ROUNDS = 16
+CALIBRATION_SAMPLES = 3
+
+
+class PasswordHashingBusy(RuntimeError):
+    pass
+
+
+class PasswordHasher:
+    # bcrypt on a fixed pool of threads; beyond workers + queue_depth calls, or after timeout,
+    # PasswordHashingBusy is raised so a login burst fails fast
+    def __init__(self, workers, queue_depth, timeout):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingBusy('Password hashing queue is full')
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the work finishes, even if the caller stops waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise PasswordHashingBusy('Timed out waiting for password hashing') from None
+
+    def hash(self, password):
+        return self._run(bcrypt.generate_password_hash, password.encode('utf-8')).decode('utf-8')
+
+    def check(self, hashed_password, password):
+        return self._run(bcrypt.check_password_hash, hashed_password, password.encode('utf-8'))
+
+    def needs_rehash(self, hashed_password):
+        return hash_cost(hashed_password) != app.config['BCRYPT_LOG_ROUNDS']
+
+
+def hash_cost(hashed_password):
+    # Modular crypt format: $2b$<cost>$<salt and hash>
+    return int(hashed_password.split('$')[2])
+
+
+password_hasher = PasswordHasher(
+    app.config['PASSWORD_HASH_WORKERS'],
+    app.config['PASSWORD_HASH_QUEUE_DEPTH'],
+    app.config['PASSWORD_HASH_TIMEOUT'],
+)
+
+
+def time_hash(log_rounds):
+    # Median milliseconds to hash one password at log_rounds on this host
+    timings = []
+    for _ in range(CALIBRATION_SAMPLES):
+        started = time.perf_counter()
+        bcrypt.generate_password_hash(b'calibration', rounds=log_rounds)
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)[len(timings) // 2]
+
+
+def calibrate(target_ms):
+    # Return (log_rounds, {log_rounds: ms}) for the highest cost that hashes within target_ms
+    timings = {}
+    for log_rounds in range(MIN_LOG_ROUNDS, MAX_LOG_ROUNDS + 1):
+        timings[log_rounds] = time_hash(log_rounds)
+        # Each step doubles the work, so nothing past the first miss can fit
+        if timings[log_rounds] > target_ms:
+            break
+    fitting = [log_rounds for log_rounds, ms in timings.items() if ms <= target_ms]
+    return max(fitting, default=MIN_LOG_ROUNDS), timings
+
+
+def busy_response():
+    return make_response(
+        {"error": "Too many sign-ins right now. Please try again shortly."},
+        503,
+        {'Retry-After': str(RETRY_AFTER_SECONDS)},
+    )
@@ -1,10 +1,22 @@
-from flask_restful import Resource, reqparse
+from flask_restful import Resource, reqparse, inputs
 from flask import request, session, make_response
-import os
-import time
-from ..models.dj import Dj, Genre, Subgenre, Venue, db
-from ..models.user import User
-from sqlalchemy import func
+import io
+from ..models.dj import Dj, DjDocument, DjGenre, DjSubgenre, DjVenue, Genre, Subgenre, Venue, canonical_genre_title, genre_key, normalize_key, db
+from ..auth import current_identity
+from ..pagination import keyset_page, page_size, encode_cursor, decode_typed_cursor, InvalidCursor
+from ..search import index_djs, remove_djs, search_djs, matching_dj_ids
+from ..facets import facet_criteria, facet_counts
+from ..responses import stream_json_documents, json_with_documents, json_document, cached_json, conditional, STREAM_CHUNK_SIZE
+from ..versioning import bump_versions, catalog_etag, dj_etag
+from ..cache import taxonomy_cache
+from ..routing import read_only
+from ..taxonomy import genre_ids, subgenre_ids, venue_ids, sync_associations, committed, unique_violation_table
+from ..upserts import upsert
+from ..media import store_upload, release, lock_owner, uploaded_image, UploadRejected
+from ..importer import import_djs, format_for, READERS, IMPORT_CHUNK_SIZE
+from ..documents import store_documents, remove_documents, complete_documents, document_rows, documents_in_order
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
 
 class AddDj(Resource):
     def post(self):
@@ -12,7 +24,6 @@ class AddDj(Resource):
         parser.add_argument('name', type=str, required=True, help='DJ name cannot be blank')
         parser.add_argument('produces', type=bool, required=True, help='Music production status is required')
         parser.add_argument('city', type=str, required=True, help='City is required')
-        parser.add_argument('dj_profile_picture', type=str, help='DJ profile picture URL')
         parser.add_argument('genres', type=list, location='json', required=True, help='Genres are required')
         parser.add_argument('subgenres', type=dict, location='json', default={}, help='Subgenres by genre')
         parser.add_argument('venues', type=list, location='json', required=True, help='Venues are required')
@@ -21,96 +32,142 @@ class AddDj(Resource):
         name = args['name'].strip()
         produces = args['produces']
         city = args['city'].strip()
-        dj_profile_picture = args.get('dj_profile_picture', '')
         genres = [genre.strip().title() for genre in args['genres']]
         subgenres = {genre.strip().title(): [subgenre.strip().title() for subgenre in subs] for genre, subs in args['subgenres'].items()}
         venues = [venue.strip().title() for venue in args['venues']]
 
-        # Check for duplicates including case
-        existing_dj = db.session.query(Dj).filter(func.lower(Dj.name) == name.lower(), func.lower(Dj.city) == city.lower()).first()
-        if existing_dj:
+        return committed(lambda: self.add(name, produces, city, genres, subgenres, venues))
+
+    def add(self, name, produces, city, genres, subgenres, venues):
+        # The unique (name, city) keys decide duplicates, so two concurrent adds cannot both succeed
+        dj_id = db.session.execute(upsert(Dj).values(
+            name=name, name_key=normalize_key(name), produces=produces, city=city, city_key=normalize_key(city),
+        ).on_conflict_do_nothing().returning(Dj.id)).scalar()
+        if dj_id is None:
             return {'error': f'{name} already exists in the database for city {city}'}, 400
 
-        new_dj = Dj(name=name, produces=produces, city=city, dj_profile_picture=dj_profile_picture)
-
-        genre_mapping = {
-            "drum n bass": "Drum & Bass",
-            "dnb": "Drum & Bass",
-            "d&b": "Drum & Bass",
-            "drum and bass": "Drum & Bass",
-            "d & b": "Drum & Bass",
-            "d n b": "Drum & Bass",
-            "dubstep": "Dubstep",
-            "140": "Dubstep",
-        }
-
-        # Add genres
-        for genre_title in genres:
-            mapped_genre_title = genre_mapping.get(genre_title.lower(), genre_title)
-            genre = db.session.query(Genre).filter(func.lower(Genre.title) == mapped_genre_title.lower()).first()
-            if genre is None:
-                genre = Genre(title=mapped_genre_title)
-                db.session.add(genre)
-            if genre not in new_dj.genres:
-                new_dj.genres.append(genre)
-
-            # Add subgenres
-            for subgenre_title in subgenres.get(genre_title, []):
-                mapped_subgenre_title = genre_mapping.get(subgenre_title.lower(), subgenre_title)
-                subgenre = db.session.query(Subgenre).filter(
-                    func.lower(Subgenre.subtitle) == mapped_subgenre_title.lower(),
-                    Subgenre.genre_id == genre.id
-                ).first()
-                if not subgenre:
-                    subgenre = Subgenre(subtitle=mapped_subgenre_title, genre=genre)
-                    db.session.add(subgenre)
-                if subgenre not in genre.subgenres:
-                    genre.subgenres.append(subgenre)
-                if subgenre not in new_dj.subgenres:
-                    new_dj.subgenres.append(subgenre)
-
-        # Add venues
-        for venue_name in venues:
-            venue = db.session.query(Venue).filter(func.lower(Venue.venuename) == venue_name.lower()).first()
-            if venue is None:
-                venue = Venue(venuename=venue_name)
-                db.session.add(venue)
-            if venue not in new_dj.venues:
-                new_dj.venues.append(venue)
-
-        db.session.add(new_dj)
-        db.session.commit()
+        # Subgenres are only kept for the DJ's own genres
+        genre_id_by_key = genre_ids((), create=genres)
+        genre_id_list = [genre_id_by_key[genre_key(canonical_genre_title(title))] for title in genres]
+        pairs = [(genre_id, subtitle) for title, genre_id in zip(genres, genre_id_list) for subtitle in subgenres.get(title, [])]
+        subgenre_id_by_key = subgenre_ids(pairs)
+        venue_id_by_key = venue_ids(venues)
+
+        associations = (
+            (DjGenre, 'genre_id', genre_id_list),
+            (DjSubgenre, 'subgenre_id', [subgenre_id_by_key[(genre_id, genre_key(canonical_genre_title(subtitle)))] for genre_id, subtitle in pairs]),
+            (DjVenue, 'venue_id', [venue_id_by_key[normalize_key(venue)] for venue in venues]),
+        )
+        for model, column, ids in associations:
+            if ids:
+                db.session.execute(insert(model), [{'dj_id': dj_id, column: target_id} for target_id in dict.fromkeys(ids)])
+
+        new_dj = Dj.catalog_query().filter(Dj.id == dj_id).one()
+        index_djs([new_dj])
+        store_documents([new_dj])
+        bump_versions(new_dj)
         return {'message': f'{name} added successfully'}, 201
 
 class ViewDjs(Resource):
+    method_decorators = [read_only]
+
     def get(self):
-        # Retrieve all DJs, sorted alphabetically by name
-        djs = db.session.query(Dj).order_by(Dj.name).all()
-        result = [dj.to_detailed_dict() for dj in djs]
-        return make_response(result, 200)
+        parser = reqparse.RequestParser()
+        parser.add_argument('limit', type=int, location='args', help='Page size')
+        parser.add_argument('cursor', type=str, location='args', help='Cursor returned as next by the previous page')
+        args = parser.parse_args()
+
+        # Unchanged catalog: 304 without loading or serializing any DJ
+        return conditional(catalog_etag(), lambda: self.djs(args))
+
+    def djs(self, args):
+        if args['limit'] is not None or args['cursor']:
+            try:
+                documents, next_cursor = djs_page(args)
+            except InvalidCursor as e:
+                return make_response({'error': str(e)}, 400)
+            return json_with_documents('djs', documents, {'next': next_cursor})
+
+        # Stream all DJs, sorted alphabetically by name
+        return streamed_djs()
     
 class ViewDj(Resource):
+    method_decorators = [read_only]
+
     def get(self, dj_id):
-        dj = Dj.query.get(dj_id)
-        if dj:
-            return dj.to_detailed_dict(), 200
-        return {'message': 'DJ not found'}, 404
+        etag = dj_etag(dj_id)
+        if etag is None:
+            return {'message': 'DJ not found'}, 404
+        return conditional(etag, lambda: self.dj(dj_id))
+
+    def dj(self, dj_id):
+        for document in documents_in_order([dj_id]):
+            return json_document(document)
+        return make_response({'message': 'DJ not found'}, 404)
 
 class SearchDjs(Resource):
+    method_decorators = [read_only]
+
     def get(self):
         parser = reqparse.RequestParser()
-        parser.add_argument('search', type=str, help='Search term for DJ names')
+        parser.add_argument('search', type=str, location='args', help='Search term matched against DJ names, cities, genres, subgenres and venues')
+        parser.add_argument('genre', type=str, location='args', action='append', help='Only DJs with this genre (repeatable)')
+        parser.add_argument('subgenre', type=str, location='args', action='append', help='Only DJs with this subgenre (repeatable)')
+        parser.add_argument('venue', type=str, location='args', action='append', help='Only DJs playing this venue (repeatable)')
+        parser.add_argument('city', type=str, location='args', action='append', help='Only DJs from this city (repeatable)')
+        parser.add_argument('produces', type=inputs.boolean, location='args', help='Only DJs who do (true) or do not (false) produce')
+        parser.add_argument('facets', type=inputs.boolean, location='args', default=False, help='Include per-facet counts')
+        parser.add_argument('limit', type=int, location='args', help='Page size')
+        parser.add_argument('cursor', type=str, location='args', help='Cursor returned as next by the previous page')
         args = parser.parse_args()
 
+        return conditional(catalog_etag(), lambda: self.djs(args))
+
+    def djs(self, args):
         search_term = args['search']
-        
-        if search_term:
-            djs = db.session.query(Dj).filter(Dj.name.ilike(f'%{search_term}%')).order_by(Dj.name).all()
-        else:
-            djs = db.session.query(Dj).order_by(Dj.name).all()
+        criteria = facet_criteria(args['genre'], args['subgenre'], args['venue'], args['city'], args['produces'])
 
-        result = [dj.to_detailed_dict() for dj in djs]
-        return make_response(result, 200)
+        if args['limit'] is None and not args['cursor'] and not args['facets']:
+            # Full-text matches come back ranked by relevance rather than by name
+            return streamed_ranked(search_term, *criteria) if search_term else streamed_djs(*criteria)
+
+        try:
+            documents, next_cursor = ranked_page(search_term, args, *criteria) if search_term else djs_page(args, *criteria)
+        except InvalidCursor as e:
+            return make_response({'error': str(e)}, 400)
+
+        fields = {'next': next_cursor}
+        if args['facets']:
+            fields['facets'] = facet_counts(matching_dj_ids(search_term, criteria))
+        return json_with_documents('djs', documents, fields)
+
+def streamed_djs(*criteria):
+    # Stored documents come off the cursor STREAM_CHUNK_SIZE at a time and are copied out unparsed
+    query = document_rows(*criteria).order_by(Dj.name, Dj.id)
+    rows = db.session.execute(query.execution_options(yield_per=STREAM_CHUNK_SIZE))
+    return stream_json_documents(complete_documents(rows.tuples()))
+
+def djs_page(args, *criteria):
+    # Keyset page over (name, id) as (documents, next); next is None on the last page
+    query = db.session.query(Dj.id, DjDocument.document, Dj.name).outerjoin(DjDocument, DjDocument.dj_id == Dj.id).filter(*criteria)
+    rows, next_cursor = keyset_page(query, [Dj.name, Dj.id], page_size(args['limit']), args['cursor'])
+    return list(complete_documents((row.id, row.document) for row in rows)), next_cursor
+
+def streamed_ranked(search_term, *criteria):
+    dj_ids = [dj_id for dj_id, _ in search_djs(search_term, criteria=criteria)]
+    return stream_json_documents(documents_in_order(dj_ids))
+
+def ranked_page(search_term, args, *criteria):
+    # Keyset page over (score, id) of the full-text ranking, as (documents, next)
+    limit = page_size(args['limit'])
+    after = decode_typed_cursor(args['cursor'], (float, int)) if args['cursor'] else None
+
+    ranked = search_djs(search_term, limit + 1, after, criteria)
+    next_cursor = None
+    if len(ranked) > limit:
+        last_id, last_score = ranked[limit - 1]
+        next_cursor = encode_cursor(last_score, last_id)
+    return list(documents_in_order([dj_id for dj_id, _ in ranked[:limit]])), next_cursor
 
 class UpdateDj(Resource):
     def patch(self, dj_id):
@@ -121,15 +178,19 @@ class UpdateDj(Resource):
         parser.add_argument('name', type=str)
         parser.add_argument('produces', type=bool)
         parser.add_argument('city', type=str)
-        parser.add_argument('dj_profile_picture', type=str)
         parser.add_argument('genres', type=list, location='json')
-        parser.add_argument('subgenres', type=dict, location='json', default={})
+        parser.add_argument('subgenres', type=dict, location='json')
         parser.add_argument('venues', type=list, location='json')
         args = parser.parse_args()
 
-        dj = db.session.query(Dj).get(dj_id)
-        if not dj:
+        return committed(lambda: self.update(dj_id, args))
+
+    def update(self, dj_id, args):
+        # Lock the DJ row before reading its associations, so a concurrent PATCH waits and then
+        # works from the rows this one wrote (SQLite writers are already serialized by committed())
+        if db.session.execute(select(Dj.id).where(Dj.id == dj_id).with_for_update()).scalar() is None:
             return {'error': 'DJ not found'}, 404
+        dj = Dj.catalog_query().filter(Dj.id == dj_id).populate_existing().one()
 
         if args['name']:
             dj.name = args['name'].strip().title()
@@ -137,59 +198,53 @@ class UpdateDj(Resource):
             dj.produces = args['produces']
         if args['city']:
             dj.city = args['city'].strip().title()
-        if args['dj_profile_picture']:
-            dj.dj_profile_picture = args['dj_profile_picture'].strip()
+        # The unique (name, city) keys are checked here, before anything else is written
+        name, city = dj.name, dj.city
+        changed = db.session.is_modified(dj, include_collections=False)
+        try:
+            db.session.flush()
+        except IntegrityError as e:
+            if unique_violation_table(e) != Dj.__tablename__:
+                raise
+            db.session.rollback()
+            return {'error': f'{name} already exists in the database for city {city}'}, 400
+
+        # Resolve every requested name with one statement or two per taxonomy, then write only
+        # the association rows that actually change
+        genre_titles = args['genres'] or []
+        subgenre_titles = args['subgenres'] or {}
+        genre_id_by_key = genre_ids(subgenre_titles, create=genre_titles)
 
-        # Update genres
         if args['genres'] is not None:
-            dj.genres.clear()
-            genre_mapping = {
-                "drum n bass": "Drum & Bass",
-                "dnb": "Drum & Bass",
-                "d&b": "Drum & Bass",
-                "drum and bass": "Drum & Bass",
-                "d & b": "Drum & Bass",
-                "d n b": "Drum & Bass",
-                "dubstep": "Dubstep",
-                "140": "Dubstep",
-            }
-            for genre_title in args['genres']:
-                mapped_genre_title = genre_mapping.get(genre_title.lower(), genre_title.title())
-                genre = db.session.query(Genre).filter(func.lower(Genre.title) == mapped_genre_title.lower()).first()
-                if genre is None:
-                    genre = Genre(title=mapped_genre_title)
-                    db.session.add(genre)
-                dj.genres.append(genre)
-
-        # Update subgenres
+            targets = [genre_id_by_key[genre_key(canonical_genre_title(title))] for title in genre_titles]
+            changed |= sync_associations(dj.dj_genres, 'genre_id', targets, lambda genre_id: DjGenre(genre_id=genre_id))
+
         if args['subgenres'] is not None:
-            dj.subgenres.clear()
-            for genre_title, subgenre_titles in args['subgenres'].items():
-                mapped_genre_title = genre_mapping.get(genre_title.lower(), genre_title.title())
-                genre = db.session.query(Genre).filter(func.lower(Genre.title) == mapped_genre_title.lower()).first()
-                if genre:
-                    for subgenre_title in subgenre_titles:
-                        mapped_subgenre_title = genre_mapping.get(subgenre_title.lower(), subgenre_title.title())
-                        subgenre = db.session.query(Subgenre).filter(
-                            func.lower(Subgenre.subtitle) == mapped_subgenre_title.lower(),
-                            Subgenre.genre_id == genre.id
-                        ).first()
-                        if not subgenre:
-                            subgenre = Subgenre(subtitle=mapped_subgenre_title, genre=genre)
-                            db.session.add(subgenre)
-                        dj.subgenres.append(subgenre)
-
-        # Update venues
-        if args['venues'] is not None:
-            dj.venues.clear()
-            for venue_name in args['venues']:
-                venue = db.session.query(Venue).filter(func.lower(Venue.venuename) == venue_name.lower()).first()
-                if venue is None:
-                    venue = Venue(venuename=venue_name)
-                    db.session.add(venue)
-                dj.venues.append(venue)
+            # Subgenres of genres that don't exist are ignored
+            pairs = [
+                (genre_id_by_key[genre_key(genre_title)], subtitle)
+                for genre_title, subtitles in subgenre_titles.items()
+                if genre_key(genre_title) in genre_id_by_key
+                for subtitle in subtitles
+            ]
+            subgenre_id_by_key = subgenre_ids(pairs)
+            targets = [subgenre_id_by_key[(genre_id, genre_key(canonical_genre_title(subtitle)))] for genre_id, subtitle in pairs]
+            changed |= sync_associations(dj.dj_subgenres, 'subgenre_id', targets, lambda subgenre_id: DjSubgenre(subgenre_id=subgenre_id))
 
-        db.session.commit()
+        if args['venues'] is not None:
+            venue_id_by_key = venue_ids(args['venues'])
+            targets = [venue_id_by_key[normalize_key(venue)] for venue in args['venues']]
+            changed |= sync_associations(dj.dj_venues, 'venue_id', targets, lambda venue_id: DjVenue(venue_id=venue_id))
+
+        # Nothing to re-index, re-version or re-serialize when the request changed nothing
+        if not changed:
+            return {'message': 'DJ updated successfully'}, 200
+        db.session.flush()
+        # Index and serialize what the tables now hold, not the collections edited above
+        dj = Dj.catalog_query().filter(Dj.id == dj_id).populate_existing().one()
+        index_djs([dj])
+        store_documents([dj])
+        bump_versions(dj)
         return {'message': 'DJ updated successfully'}, 200
 
     def _is_admin(self):
@@ -197,115 +252,147 @@ class UpdateDj(Resource):
 
 class DeleteDj(Resource):
     def delete(self, dj_id):
-        user_id = session.get('user_id')
-        if not user_id:
+        identity = current_identity()
+        if not identity:
             return make_response({'error': 'Unauthorized'}, 401)
 
-        current_user = User.query.get(user_id)
-        if not current_user:
-            return make_response({'error': 'Unauthorized'}, 401)
+        if not identity.is_admin:
+            return make_response({'error': 'Forbidden'}, 403)
 
         # Proceed with deletion if user is admin
-        dj_to_delete = Dj.query.get(dj_id)
+        dj_to_delete = lock_owner(Dj, dj_id)
         if not dj_to_delete:
             return make_response({'error': 'DJ not found'}, 404)
-        
-        if current_user.is_admin:
-            db.session.delete(dj_to_delete)
-            db.session.commit()
-            return make_response({'message': 'DJ deleted successfully'}, 200)
-        
-        return make_response({'error': 'Forbidden'}, 403)
+
+        if dj_to_delete.dj_profile_picture:
+            release('dj-profiles', dj_to_delete.dj_profile_picture)
+        remove_documents([dj_id])
+        db.session.delete(dj_to_delete)
+        remove_djs([dj_id])
+        bump_versions()
+        db.session.commit()
+        return make_response({'message': 'DJ deleted successfully'}, 200)
+
+class ImportDjs(Resource):
+    def post(self):
+        identity = current_identity()
+        if not identity:
+            return make_response({'error': 'Unauthorized'}, 401)
+        if not identity.is_admin:
+            return make_response({'error': 'Forbidden'}, 403)
+
+        parser = reqparse.RequestParser()
+        parser.add_argument('format', type=str, location='args', choices=sorted(READERS), help='ndjson or csv')
+        parser.add_argument('chunk_size', type=int, location='args', default=IMPORT_CHUNK_SIZE, help='Rows per transaction')
+        args = parser.parse_args()
+
+        # Either a multipart 'file' upload or the raw request body
+        upload = request.files.get('file')
+        if upload:
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+            file_format = args['format'] or format_for(upload.filename)
+        else:
+            stream = io.TextIOWrapper(io.BufferedReader(request.stream), encoding='utf-8', newline='')
+            file_format = args['format'] or {'text/csv': 'csv', 'application/x-ndjson': 'ndjson'}.get(request.mimetype)
+
+        if file_format not in READERS:
+            return make_response({'error': 'Send ndjson or csv, or pass ?format='}, 400)
+
+        report = import_djs(READERS[file_format](stream), max(1, args['chunk_size']))
+        return make_response(report, 200)
 
 class GenreList(Resource):
+    method_decorators = [read_only]
+
     def get(self):
         try:
-            genres = db.session.query(Genre).all()
-            return [{'id': genre.id, 'title': genre.title} for genre in genres], 200
+            return cached_json(taxonomy_cache, 'genres', self.genres)
         except Exception as e:
             return {'error': str(e)}, 500
+
+    def genres(self):
+        genres = db.session.query(Genre).all()
+        return [{'id': genre.id, 'title': genre.title} for genre in genres]
         
 class SubgenreList(Resource):
+    method_decorators = [read_only]
+
     def get(self, genre_title):
         try:
-            genre = db.session.query(Genre).filter(func.lower(Genre.title) == genre_title.lower()).first()
-            if not genre:
-                return {'message': 'Genre not found'}, 404
-            subgenres = db.session.query(Subgenre).filter(Subgenre.genre_id == genre.id).all()
-            return [{'id': subgenre.id, 'subtitle': subgenre.subtitle} for subgenre in subgenres]
+            key = f'subgenres:{genre_key(genre_title)}'
+            if taxonomy_cache.get(key) is None:
+                genre = db.session.query(Genre.id).filter(Genre.title_key == genre_key(genre_title)).first()
+                if not genre:
+                    return {'message': 'Genre not found'}, 404
+            return cached_json(taxonomy_cache, key, lambda: self.subgenres(genre_title))
         except Exception as e:
             return {'error': str(e)}, 500
+
+    def subgenres(self, genre_title):
+        subgenres = db.session.query(Subgenre).join(Genre, Genre.id == Subgenre.genre_id).filter(
+            Genre.title_key == genre_key(genre_title)
+        ).all()
+        return [{'id': subgenre.id, 'subtitle': subgenre.subtitle} for subgenre in subgenres]
         
 class VenueList(Resource):
+    method_decorators = [read_only]
+
     def get(self):
         try:
-            venues = db.session.query(Venue).all()
-            return [{'id': venue.id, 'venuename': venue.venuename} for venue in venues], 200
+            return cached_json(taxonomy_cache, 'venues', self.venues)
         except Exception as e:
             return {'error': str(e)}, 500
 
+    def venues(self):
+        venues = db.session.query(Venue).all()
+        return [{'id': venue.id, 'venuename': venue.venuename} for venue in venues]
 
-class DJProfileImage(Resource):
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '..', '..', 'client', 'public', 'dj-profiles')
-
-    def __init__(self):
-        if not os.path.exists(self.UPLOAD_FOLDER):
-            os.makedirs(self.UPLOAD_FOLDER)
 
+class DJProfileImage(Resource):
     def post(self, dj_id):
         dj = Dj.query.get(dj_id)
         if not dj:
             return make_response({"error": "DJ not found"}, 404)
 
-        if 'profileImage' not in request.files:
-            return make_response({"error": "No image provided."}, 400)
-
-        file = request.files['profileImage']
-        if file.filename == '':
-            return make_response({"error": "No selected file."}, 400)
-
-        if not self.allowed_file(file.filename):
-            return make_response({"error": "Unsupported file type."}, 400)
+        try:
+            filename = store_upload('dj-profiles', uploaded_image())
+        except UploadRejected as e:
+            return make_response({"error": str(e)}, e.status)
 
-        timestamp = int(time.time())
-        filename = f"{dj_id}_{timestamp}.jpg"
-        file_path = os.path.join(self.UPLOAD_FOLDER, filename)
-        file.save(file_path)
+        # Locked only once the body has been read
+        dj = lock_owner(Dj, dj_id)
+        if not dj:
+            db.session.rollback()
+            return make_response({"error": "DJ not found"}, 404)
 
         if dj.dj_profile_picture:
-            old_image_path = os.path.join(self.UPLOAD_FOLDER, dj.dj_profile_picture)
-            if os.path.exists(old_image_path):
-                os.remove(old_image_path)
+            release('dj-profiles', dj.dj_profile_picture)
 
-        dj.dj_profile_picture = filename
+        # Re-uploading the current image changes nothing the catalog shows
+        if filename != dj.dj_profile_picture:
+            dj.dj_profile_picture = filename
+            store_documents([dj])
+            bump_versions(dj)
         db.session.commit()
 
         return make_response({"message": "Profile image uploaded successfully."}, 200)
 
-    def allowed_file(self, filename):
-        ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-        return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
 
 
 class DeleteDJProfileImage(Resource):
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '..', '..', 'client', 'public', 'dj-profiles')
-
     def delete(self, dj_id):
-        dj = Dj.query.get(dj_id)
+        dj = lock_owner(Dj, dj_id)
         if not dj:
             return make_response({"error": "DJ not found"}, 404)
 
         if not dj.dj_profile_picture:
             return make_response({"error": "No profile image to delete."}, 400)
 
-        old_image_path = os.path.join(self.UPLOAD_FOLDER, dj.dj_profile_picture)
-        if os.path.exists(old_image_path):
-            os.remove(old_image_path)
-        else:
-            return make_response({"error": "Profile image file not found."}, 404)
-
+        # The file itself goes after commit, once no other DJ uses it
+        release('dj-profiles', dj.dj_profile_picture)
         dj.dj_profile_picture = None
+        store_documents([dj])
+        bump_versions(dj)
         db.session.commit()
 
         return make_response({"message": "Profile image deleted successfully."}, 200)
@@ -1,10 +1,16 @@
 from flask_restful import Resource, reqparse
 from flask import request, session, make_response
-import os
-import time
 from server.models.user import User, db
-from server.config import bcrypt
+from server.passwords import PasswordHashingBusy, busy_response
+from server.auth import current_identity, current_user
 from server.models.dj import Dj
+from server.pagination import keyset_page, page_size, starts_with, InvalidCursor
+from server.media import store_upload, release, lock_owner, uploaded_image, UploadRejected
+from server.favourites import add_favourites, remove_favourites, existing_dj_ids, user_exists, MAX_BULK_FAVOURITES
+
+def expand_favourites():
+    # ?expand=favourites adds the full favourite DJs to a user; otherwise only favourite_ids
+    return 'favourites' in request.args.get('expand', '').split(',')
 
 class Signup(Resource):
     def post(self):
@@ -20,7 +26,10 @@ class Signup(Resource):
             return make_response({"error": "User already exists"}, 400)
 
         new_user = User(username=data['username'], is_admin=data['is_admin'])
-        new_user.hashed_password = data['password']
+        try:
+            new_user.hashed_password = data['password']
+        except PasswordHashingBusy:
+            return busy_response()
 
         db.session.add(new_user)
         db.session.commit()
@@ -39,11 +48,16 @@ class Login(Resource):
         if not user:
             return make_response({"message": "User not found"}, 404)
 
-        if user and not user.authenticate(password):
+        try:
+            authenticated = user.authenticate(password)
+        except PasswordHashingBusy:
+            return busy_response()
+        if not authenticated:
             return make_response({"message": "Incorrect password"}, 401)
+        db.session.commit()  # Saves the password hash if authenticate upgraded its cost
 
         session['user_id'] = user.id
-        return make_response({"user": user.to_dict()}, 200)
+        return make_response({"user": user.to_dict(expand_favourites())}, 200)
 
 
 class Logout(Resource):
@@ -59,14 +73,14 @@ class Me(Resource):
             return make_response({"error": "Session expired. Please log in again."}, 403)
 
         # Fetch the user from the database
-        user = User.query.get(user_id)
+        user = current_user()
         if not user:
             # Clear the session if the user is not found
             session.pop('user_id', None)
             return make_response({"error": "User not found"}, 404)
 
         # Return the user's data
-        return make_response(user.to_dict(), 200)
+        return make_response(user.to_dict(expand_favourites()), 200)
 
     def patch(self):
         # Check if user_id is in the session
@@ -75,7 +89,7 @@ class Me(Resource):
             return make_response({"error": "Session expired. Please log in again."}, 403)
 
         # Fetch the user from the database
-        user = User.query.get(user_id)
+        user = current_user()
         if not user:
             # Clear the session if the user is not found
             session.pop('user_id', None)
@@ -87,11 +101,14 @@ class Me(Resource):
         old_password = data.get('oldPassword')
         new_password = data.get('newPassword')
         if old_password and new_password:
-            if not user.authenticate(old_password):
-                return make_response({"error": "Old password is incorrect."}, 401)
-
-            # Update password
-            user.hashed_password = new_password
+            try:
+                if not user.authenticate(old_password):
+                    return make_response({"error": "Old password is incorrect."}, 401)
+
+                # Update password
+                user.hashed_password = new_password
+            except PasswordHashingBusy:
+                return busy_response()
             db.session.commit()
             return make_response({"message": "Password updated successfully."}, 200)
 
@@ -121,44 +138,30 @@ class Me(Resource):
 
 
 class ProfileImage(Resource):
-    # Define the path to the public directory
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '..',  '..', 'client', 'public', 'user-profiles')
-
-    def __init__(self):
-        # Ensure the upload directory exists
-        if not os.path.exists(self.UPLOAD_FOLDER):
-            os.makedirs(self.UPLOAD_FOLDER)
-
     def post(self):
         user_id = session.get('user_id')
         if not user_id:
             return make_response({"error": "Not signed in"}, 403)
 
-        user = User.query.get(user_id)
+        user = current_user()
         if not user:
             return make_response({"error": "User not found"}, 404)
 
-        if 'profileImage' not in request.files:
-            return make_response({"error": "No image provided."}, 400)
-
-        file = request.files['profileImage']
-        if file.filename == '':
-            return make_response({"error": "No selected file."}, 400)
+        # Save new profile image under its content hash in the 'user-profiles' media folder
+        try:
+            filename = store_upload('user-profiles', uploaded_image())
+        except UploadRejected as e:
+            return make_response({"error": str(e)}, e.status)
 
-        if not self.allowed_file(file.filename):
-            return make_response({"error": "Unsupported file type."}, 400)
-
-        # Save new profile image in 'public/user-profiles' folder
-        timestamp = int(time.time())
-        filename = f"{user.username}_{timestamp}.jpg"
-        file_path = os.path.join(self.UPLOAD_FOLDER, filename)
-        file.save(file_path)
+        # Locked only once the body has been read
+        user = lock_owner(User, user.id)
+        if not user:
+            db.session.rollback()
+            return make_response({"error": "User not found"}, 404)
 
-        # Remove old profile image if exists
+        # Release the old profile image; its file goes once nothing else uses it
         if user.profile_image_url:
-            old_image_path = os.path.join(self.UPLOAD_FOLDER, user.profile_image_url)
-            if os.path.exists(old_image_path):
-                os.remove(old_image_path)
+            release('user-profiles', user.profile_image_url)
 
         # Update user's profile image URL in the database
         user.profile_image_url = filename
@@ -166,28 +169,21 @@ class ProfileImage(Resource):
 
         return make_response({"message": "Profile image uploaded successfully."}, 200)
     
-
-    def allowed_file(self, filename):
-        ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-        return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-    
 class DeleteProfileImage(Resource):
     def delete(self):
         user_id = session.get('user_id')
         if not user_id:
             return make_response({"error": "Not signed in"}, 403)
 
-        user = User.query.get(user_id)
+        user = current_user() and lock_owner(User, session['user_id'])
         if not user:
             return make_response({"error": "User not found"}, 404)
 
         if not user.profile_image_url:
             return make_response({"error": "No profile image to delete."}, 400)
 
-        # Remove old profile image if exists
-        old_image_path = os.path.join(ProfileImage.UPLOAD_FOLDER, user.profile_image_url)
-        if os.path.exists(old_image_path):
-            os.remove(old_image_path)
+        # Release the old profile image; its file goes once nothing else uses it
+        release('user-profiles', user.profile_image_url)
 
         # Update user's profile image URL in the database
         user.profile_image_url = None
@@ -201,23 +197,36 @@ class Users(Resource):
     def get(self, user_id=None):
         if user_id is None:
             # List all users
-            current_user_id = session.get('user_id')
-            current_user = User.query.get(current_user_id)
-            
-            if current_user and current_user.is_admin:
-                users = [u.to_dict() for u in User.query.all()]
-                return make_response(users, 200)
-            return make_response({"error": "Access forbidden"}, 403)
+            identity = current_identity()
+            if not (identity and identity.is_admin):
+                return make_response({"error": "Access forbidden"}, 403)
+            return self.users()
         else:
             # Retrieve a specific user
             user = User.query.get(user_id)
             if user:
-                return make_response(user.to_dict(), 200)
+                return make_response(user.to_dict(expand_favourites()), 200)
             return make_response({"error": "User not found"}, 404)
     
+    def users(self):
+        parser = reqparse.RequestParser()
+        parser.add_argument('limit', type=int, location='args', help='Page size')
+        parser.add_argument('cursor', type=str, location='args', help='Cursor returned as next by the previous page')
+        parser.add_argument('prefix', type=str, location='args', help='Only usernames starting with this')
+        args = parser.parse_args()
+
+        # Scalar columns only, keyset-paged over the unique username index
+        query = db.session.query(User.id, User.username, User.is_admin, User.profile_image_url)
+        if args['prefix']:
+            query = query.filter(*starts_with(User.username, args['prefix']))
+        try:
+            rows, next_cursor = keyset_page(query, [User.username], page_size(args['limit']), args['cursor'])
+        except InvalidCursor as e:
+            return make_response({'error': str(e)}, 400)
+        return make_response({'users': [row._asdict() for row in rows], 'next': next_cursor}, 200)
+
     def delete(self, identifier):
-        current_user_id = session.get('user_id')
-        current_user = User.query.get(current_user_id)
+        identity = current_identity()
 
         # Check if deleting by ID or username
         if identifier.isdigit():
@@ -225,23 +234,28 @@ class Users(Resource):
         else:
             user_to_delete = User.query.filter_by(username=identifier).first()
 
-        if not current_user:
+        if not identity:
             return make_response({'error': 'Current user not found'}, 404)
         
+        user_to_delete = user_to_delete and lock_owner(User, user_to_delete.id)
         if not user_to_delete:
             return make_response({'error': 'User not found'}, 404)
         
         # Allow user to delete their own account regardless of admin status
-        if current_user.id == user_to_delete.id:
+        if identity.id == user_to_delete.id:
+            if user_to_delete.profile_image_url:
+                release('user-profiles', user_to_delete.profile_image_url)
             db.session.delete(user_to_delete)
             db.session.commit()
             return make_response({'message': 'Your account has been deleted successfully'}, 200)
         
         # Allow admin to delete any account including their own, but not other admins
-        if current_user.is_admin:
+        if identity.is_admin:
             if user_to_delete.is_admin:
                 return make_response({'error': 'Admins cannot delete other admin accounts'}, 403)
 
+            if user_to_delete.profile_image_url:
+                release('user-profiles', user_to_delete.profile_image_url)
             db.session.delete(user_to_delete)
             db.session.commit()
             return make_response({'message': 'User deleted successfully'}, 200)
@@ -254,19 +268,33 @@ class Favourites(Resource):
         if not user_id:
             return make_response({"error": "Not signed in"}, 403)
 
-        user = User.query.get(user_id)
-        if user:
-            favourites = [user.serialize_favourites(dj) for dj in user.favourites]
+        user = current_user()
+        if not user:
+            return make_response({"error": "User not found"}, 404)
+
+        parser = reqparse.RequestParser()
+        parser.add_argument('limit', type=int, location='args', help='Page size')
+        parser.add_argument('cursor', type=str, location='args', help='Cursor returned as next by the previous page')
+        args = parser.parse_args()
+
+        if args['limit'] is None and not args['cursor']:
+            favourites = [user.serialize_favourites(dj) for dj in user.favourite_djs()]
             return {'favourites': favourites}, 200
-        return make_response({"error": "User not found"}, 404)
+
+        # Keyset page over (name, id); next is None on the last page
+        try:
+            djs, next_cursor = keyset_page(user.favourites_query(), [Dj.name, Dj.id], page_size(args['limit']), args['cursor'])
+        except InvalidCursor as e:
+            return make_response({'error': str(e)}, 400)
+        return {'favourites': [user.serialize_favourites(dj) for dj in djs], 'next': next_cursor}, 200
 
     def post(self):
         user_id = session.get('user_id')
         if not user_id:
             return make_response({"error": "Not signed in"}, 403)
 
-        user = User.query.get(user_id)
-        if not user:
+        identity = current_identity()
+        if not identity:
             return make_response({"error": "User not found"}, 404)
 
         data = request.get_json()
@@ -275,14 +303,13 @@ class Favourites(Resource):
         if not dj_id:
             return make_response({"error": "DJ ID is required"}, 400)
 
-        dj = Dj.query.get(dj_id)
-        if not dj:
-            return make_response({"error": "DJ not found"}, 404)
-
-        if dj in user.favourites:
+        # Straight against user_dj_favourites; the user's favourites are never loaded
+        if not add_favourites(identity.id, [dj_id]):
+            if not user_exists(identity.id):
+                return make_response({"error": "User not found"}, 404)
+            if not existing_dj_ids([dj_id]):
+                return make_response({"error": "DJ not found"}, 404)
             return make_response({"message": "DJ is already in favourites"}, 400)
-
-        user.favourites.append(dj)
         db.session.commit()
 
         return make_response({"message": "DJ added to favourites"}, 200)
@@ -292,8 +319,8 @@ class Favourites(Resource):
         if not user_id:
             return make_response({"error": "Not signed in"}, 403)
 
-        user = User.query.get(user_id)
-        if not user:
+        identity = current_identity()
+        if not identity:
             return make_response({"error": "User not found"}, 404)
 
         data = request.get_json()
@@ -302,14 +329,40 @@ class Favourites(Resource):
         if not dj_id:
             return make_response({"error": "DJ ID is required"}, 400)
 
-        dj = Dj.query.get(dj_id)
-        if not dj:
-            return make_response({"error": "DJ not found"}, 404)
-
-        if dj not in user.favourites:
+        if not remove_favourites(identity.id, [dj_id]):
+            if not existing_dj_ids([dj_id]):
+                return make_response({"error": "DJ not found"}, 404)
             return make_response({"error": "DJ is not in favourites"}, 400)
-
-        user.favourites.remove(dj)
         db.session.commit()
 
         return make_response({"message": "DJ removed from favourites"}, 200)
+
+class BulkFavourites(Resource):
+    # {"add": [dj ids], "remove": [dj ids]}, applied in one transaction
+    def post(self):
+        user_id = session.get('user_id')
+        if not user_id:
+            return make_response({"error": "Not signed in"}, 403)
+
+        identity = current_identity()
+        if not identity:
+            return make_response({"error": "User not found"}, 404)
+
+        data = request.get_json(silent=True) or {}
+        add, remove = data.get('add') or [], data.get('remove') or []
+        for dj_ids in (add, remove):
+            if not isinstance(dj_ids, list) or not all(isinstance(dj_id, int) and not isinstance(dj_id, bool) for dj_id in dj_ids):
+                return make_response({"error": "add and remove must be lists of DJ IDs"}, 400)
+        if len(add) + len(remove) > MAX_BULK_FAVOURITES:
+            return make_response({"error": f"At most {MAX_BULK_FAVOURITES} DJ IDs per request"}, 400)
+
+        add, remove = set(add), set(remove)
+        not_found = sorted(add - existing_dj_ids(add))
+        removed = remove_favourites(identity.id, remove)
+        added = add_favourites(identity.id, add)
+        if not added and not removed and not user_exists(identity.id):
+            db.session.rollback()
+            return make_response({"error": "User not found"}, 404)
+        db.session.commit()
+
+        return make_response({"added": added, "removed": removed, "not_found": not_found}, 200)
@@ -0,0 +1,51 @@
+from flask import Response, current_app, request, stream_with_context
+
+STREAM_CHUNK_SIZE = 500
+
+
+def stream_json_documents(documents):
+    # Stream already-serialized JSON documents as a JSON array, copying each one through as is
+    def generate():
+        yield '['
+        for index, document in enumerate(documents):
+            yield (',' if index else '') + document
+        yield ']\n'
+
+    return Response(stream_with_context(generate()), status=200, mimetype='application/json')
+
+
+def json_with_documents(key, documents, fields):
+    # 200 response for {key: [documents...], **fields}, the documents spliced in as they are
+    dumps = current_app.json.dumps
+    members = [f'{dumps(key)}: [{",".join(documents)}]']
+    members += [f'{dumps(name)}: {dumps(value)}' for name, value in fields.items()]
+    return Response('{' + ', '.join(members) + '}\n', status=200, mimetype='application/json')
+
+
+def json_document(document):
+    return Response(document + '\n', status=200, mimetype='application/json')
+
+
+def cached_json(cache, key, build):
+    # Serve build()'s JSON from cache, tagged with its ETag and revalidated, so a current client gets a 304
+    entry = cache.get(key)
+    if entry is None:
+        entry = cache.set(key, current_app.json.dumps(build()).encode('utf-8'))
+
+    response = Response(entry.body, status=200, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+def conditional(etag, build):
+    # 304 for a matching If-None-Match before build() runs; etag must change whenever build()'s body would
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = build()
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -1,6 +1,7 @@
-from flask import Blueprint, make_response
+from flask import Blueprint, current_app, make_response
 from server.blueprints.user_blueprint import user_blueprint
 from server.blueprints.dj_blueprint import dj_blueprint
+from server.blueprints.media_blueprint import media_blueprint
 
 # Define a blueprint for general routes
 main_blueprint = Blueprint('main', __name__)
@@ -9,10 +10,18 @@ main_blueprint = Blueprint('main', __name__)
 def index():
     return make_response({"message": "Welcome!"}, 200)
 
+def request_too_large(error):
+    # JSON like the API's other errors; API resources answer 413 in JSON themselves
+    limit = current_app.config['MAX_CONTENT_LENGTH']
+    return make_response({"error": f"Request body is larger than {limit / (1024 * 1024):g} MB."}, 413)
+
 def register_routes(app):
+    app.register_error_handler(413, request_too_large)
     # Register the main blueprint
     app.register_blueprint(main_blueprint)
     # Register user blueprint with prefix
     app.register_blueprint(user_blueprint, url_prefix='/api')
     # Register dj blueprint with prefix
     app.register_blueprint(dj_blueprint, url_prefix='/api')
+    # Register media blueprint (profile images) at the site root
+    app.register_blueprint(media_blueprint)
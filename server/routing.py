@@ -0,0 +1,67 @@
+import random
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+
+def replica_binds(uris):
+    # SQLALCHEMY_BINDS entries for a comma-separated list of replica URIs
+    return {f'{REPLICA_BIND_PREFIX}{number}': uri.strip() for number, uri in enumerate(uris.split(',')) if uri.strip()}
+
+
+def read_only(method):
+    # Resource method decorator: the request only reads, so its queries may go to a replica
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return method(*args, **kwargs)
+    return wrapper
+
+
+def _reads_own_writes():
+    # This client wrote recently, and a replica may not have caught up yet
+    return session.get('read_primary_until', 0) > time.time()
+
+
+class RoutingSession(Session):
+    # read_only requests read from a replica, unless the session has written or the client
+    # wrote within REPLICA_STICKY_SECONDS; everything else goes to the primary
+    def _replica(self):
+        if 'replica' not in self.info:
+            replicas = [key for key in self._db.engines if key and key.startswith(REPLICA_BIND_PREFIX)]
+            self.info['replica'] = random.choice(replicas) if replicas else None
+        return self.info['replica']
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not self.info.get('wrote')
+                and has_request_context() and g.get('read_only') and not _reads_own_writes()):
+            replica = self._replica()
+            if replica is not None:
+                return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _note_flush(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _note_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(db_session):
+    if db_session.info.pop('wrote', False) and has_request_context() and current_app.config['SQLALCHEMY_BINDS']:
+        session['read_primary_until'] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_writes(db_session):
+    db_session.info.pop('wrote', None)
@@ -0,0 +1,145 @@
+import re
+from sqlalchemy import Float, Integer, column, false, select, text
+from .config import db
+from .models.dj import Dj
+from .pagination import after as keyset_after
+
+# Weights for name, city, genres, subgenres, venues: a hit on the name outranks the rest
+FIELD_WEIGHTS = (10.0, 2.0, 4.0, 3.0, 2.0)
+
+
+def search_tokens(term):
+    # Words only, so user input can never inject query syntax into MATCH / to_tsquery
+    return re.findall(r'\w+', term.lower())
+
+
+class SqliteSearchBackend:
+    # FTS5 virtual table dj_search keyed by rowid = djs.id, ranked with bm25 (lower is better)
+    def index(self, documents):
+        db.session.execute(text(
+            "INSERT OR REPLACE INTO dj_search (rowid, name, city, genres, subgenres, venues) "
+            "VALUES (:dj_id, :name, :city, :genres, :subgenres, :venues)"
+        ), documents)
+
+    def remove(self, dj_ids):
+        db.session.execute(text("DELETE FROM dj_search WHERE rowid = :dj_id"), [{'dj_id': dj_id} for dj_id in dj_ids])
+
+    def clear(self):
+        db.session.execute(text("DELETE FROM dj_search"))
+
+    def ranked(self, tokens):
+        weights = ', '.join(str(weight) for weight in FIELD_WEIGHTS)
+        return text(
+            f"SELECT rowid AS dj_id, bm25(dj_search, {weights}) AS score FROM dj_search WHERE dj_search MATCH :query"
+        ).bindparams(query=' '.join(f'"{token}"*' for token in tokens))
+
+
+class PostgresSearchBackend:
+    # dj_search table holding a weighted tsvector per DJ behind a GIN index, ranked with ts_rank
+    DOCUMENT = (
+        "setweight(to_tsvector('simple', :name), 'A') || "
+        "setweight(to_tsvector('simple', :genres), 'B') || "
+        "setweight(to_tsvector('simple', :subgenres), 'B') || "
+        "setweight(to_tsvector('simple', :city), 'C') || "
+        "setweight(to_tsvector('simple', :venues), 'C')"
+    )
+
+    def index(self, documents):
+        db.session.execute(text(
+            f"INSERT INTO dj_search (dj_id, document) VALUES (:dj_id, {self.DOCUMENT}) "
+            "ON CONFLICT (dj_id) DO UPDATE SET document = excluded.document"
+        ), documents)
+
+    def remove(self, dj_ids):
+        db.session.execute(text("DELETE FROM dj_search WHERE dj_id = :dj_id"), [{'dj_id': dj_id} for dj_id in dj_ids])
+
+    def clear(self):
+        db.session.execute(text("DELETE FROM dj_search"))
+
+    def ranked(self, tokens):
+        # Negated rank so that, as with bm25, lower scores sort first
+        return text(
+            "SELECT dj_id, -ts_rank(document, query) AS score "
+            "FROM dj_search, to_tsquery('simple', :query) AS query WHERE document @@ query"
+        ).bindparams(query=' & '.join(f'{token}:*' for token in tokens))
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def search_backend():
+    return BACKENDS[db.engine.dialect.name]()
+
+
+def search_document(dj):
+    return {
+        'dj_id': dj.id,
+        'name': dj.name,
+        'city': dj.city,
+        'genres': ' '.join(genre.title for genre in dj.genres),
+        'subgenres': ' '.join(subgenre.subtitle for subgenre in dj.subgenres),
+        'venues': ' '.join(venue.venuename for venue in dj.venues),
+    }
+
+
+def index_djs(djs):
+    # Call inside the writing transaction, after a flush, so the index commits or rolls back with it
+    documents = [search_document(dj) for dj in djs]
+    if documents:
+        search_backend().index(documents)
+
+
+def remove_djs(dj_ids):
+    if dj_ids:
+        search_backend().remove(dj_ids)
+
+
+def ranked_matches(term):
+    # Subquery of (dj_id, score) for every DJ matching term, or None when term has no words
+    tokens = search_tokens(term)
+    if not tokens:
+        return None
+    ranked = search_backend().ranked(tokens)
+    return ranked.columns(column('dj_id', Integer), column('score', Float)).subquery('ranked')
+
+
+def search_djs(term, limit=None, after=None, criteria=()):
+    # [(dj_id, score)] best match first, every word of term matched as a prefix; after is the
+    # (score, dj_id) of the previous page's last row
+    ranked = ranked_matches(term)
+    if ranked is None:
+        return []
+
+    query = select(ranked.c.dj_id, ranked.c.score)
+    if criteria:
+        query = query.where(ranked.c.dj_id.in_(select(Dj.id).where(*criteria)))
+    if after is not None:
+        query = query.where(keyset_after([ranked.c.score, ranked.c.dj_id], after))
+    query = query.order_by(ranked.c.score, ranked.c.dj_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return [(row.dj_id, row.score) for row in db.session.execute(query)]
+
+
+def matching_dj_ids(term, criteria=()):
+    # Select of the ids of every DJ that matches term (if given) and criteria
+    if not term:
+        return select(Dj.id).where(*criteria)
+    ranked = ranked_matches(term)
+    if ranked is None:
+        return select(Dj.id).where(false())
+    return select(ranked.c.dj_id).where(ranked.c.dj_id.in_(select(Dj.id).where(*criteria)))
+
+
+def rebuild_index():
+    backend = search_backend()
+    backend.clear()
+    total = 0
+    for djs in Dj.catalog_batches():
+        backend.index([search_document(dj) for dj in djs])
+        total += len(djs)
+    db.session.commit()
+    return total
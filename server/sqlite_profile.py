@@ -0,0 +1,108 @@
+import sqlite3
+import threading
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import TextClause
+from .config import db
+
+JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+TEXT_WRITES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class WriteLockTimeout(RuntimeError):
+    pass
+
+
+class WriterLock:
+    # Held by a session from the start of its write (or its first write statement) until its
+    # transaction ends, so this process's writers queue instead of failing with 'database is locked'
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def acquire(self, session):
+        if session.info.get('holds_writer_lock'):
+            return
+        if not self._lock.acquire(timeout=self.timeout):
+            raise WriteLockTimeout(f'Waited more than {self.timeout:g}s for the SQLite writer lock')
+        session.info['holds_writer_lock'] = True
+
+    def release(self, session):
+        if session.info.pop('holds_writer_lock', False):
+            self._lock.release()
+
+
+def sqlite_pragmas(config):
+    # PRAGMA statements for a new connection, from the SQLITE_* settings
+    journal_mode = config['SQLITE_JOURNAL_MODE'].upper()
+    synchronous = config['SQLITE_SYNCHRONOUS'].upper()
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(f'SQLITE_JOURNAL_MODE must be one of {sorted(JOURNAL_MODES)}')
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f'SQLITE_SYNCHRONOUS must be one of {sorted(SYNCHRONOUS_MODES)}')
+    return [
+        f'PRAGMA journal_mode = {journal_mode}',
+        f'PRAGMA synchronous = {synchronous}',
+        f"PRAGMA cache_size = {int(config['SQLITE_CACHE_SIZE'])}",
+        f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+    ]
+
+
+def _is_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        return True
+    # Raw SQL such as the full-text index maintenance
+    statement = orm_execute_state.statement
+    return isinstance(statement, TextClause) and statement.text.lstrip().upper().startswith(TEXT_WRITES)
+
+
+def _serializing(app, session):
+    return app.config['SQLITE_SERIALIZE_WRITES'] and session.get_bind().dialect.name == 'sqlite'
+
+
+def begin_write(session):
+    # Take the writer lock before a read-then-write unit of work reads anything, so no other
+    # writer in this process can change what it reads before it commits
+    writer_lock = current_app.extensions.get('sqlite_writer_lock')
+    if writer_lock is not None and _serializing(current_app, session):
+        writer_lock.acquire(session)
+
+
+def configure_sqlite(app):
+    # SQLITE_* pragmas on every new SQLite connection, read at connect time, and one writer at a time
+    writer_lock = app.extensions['sqlite_writer_lock'] = WriterLock(app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000)
+
+    def serializing(session):
+        return _serializing(app, session)
+
+    def apply_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for pragma in sqlite_pragmas(app.config):
+            cursor.execute(pragma)
+        cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', apply_pragmas)
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def _lock_before_statement(orm_execute_state):
+        if _is_write(orm_execute_state) and serializing(orm_execute_state.session):
+            writer_lock.acquire(orm_execute_state.session)
+
+    @event.listens_for(Session, 'before_flush')
+    def _lock_before_flush(session, flush_context, instances):
+        if (session.new or session.dirty or session.deleted) and serializing(session):
+            writer_lock.acquire(session)
+
+    @event.listens_for(Session, 'after_transaction_end')
+    def _unlock(session, transaction):
+        # Commit, rollback or close of the outermost transaction
+        if transaction.parent is None:
+            writer_lock.release(session)
@@ -0,0 +1,142 @@
+import random
+import re
+import time
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from .config import db
+from .models.dj import DjGenre, DjSubgenre, DjVenue, Genre, Subgenre, Venue, canonical_genre_title, first_by_key, genre_key
+from .cache import mark_taxonomy_changed
+from .upserts import upsert
+from .sqlite_profile import begin_write
+
+# Most rows written by one INSERT, kept well under SQLite's and Postgres' bound parameter limits
+UPSERT_BATCH_SIZE = 500
+WRITE_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 0.05
+UNIQUE_VIOLATION = '23505'
+# Serialization failure, deadlock
+RETRYABLE_SQLSTATES = {'40001', '40P01'}
+SQLITE_UNIQUE_FAILED = re.compile(r'UNIQUE constraint failed: (\w+)\.')
+# Two writers can both add the same association row; every other unique violation is the request's own
+RACING_TABLES = {DjGenre.__tablename__, DjSubgenre.__tablename__, DjVenue.__tablename__}
+
+
+def _get_or_create(model, lookup, keyed, row, lookup_only=()):
+    # key -> id for keyed (key -> name), inserting the missing keys with ON CONFLICT DO NOTHING;
+    # keys in lookup_only are only looked up
+    keys = {*keyed, *lookup_only}
+    if not keys:
+        return {}
+    ids = lookup(list(keys))
+    missing = [key for key in keyed if key not in ids]
+    if not missing:
+        return ids
+
+    inserted = 0
+    for start in range(0, len(missing), UPSERT_BATCH_SIZE):
+        rows = [row(key, keyed[key]) for key in missing[start:start + UPSERT_BATCH_SIZE]]
+        inserted += db.session.execute(upsert(model).values(rows).on_conflict_do_nothing()).rowcount
+    if inserted:
+        mark_taxonomy_changed(db.session)
+    ids.update(lookup(missing))
+    return ids
+
+
+def _lookup_genres(keys):
+    return dict(db.session.execute(select(Genre.title_key, Genre.id).where(Genre.title_key.in_(keys))).all())
+
+
+def genre_ids(titles, create=()):
+    # genre key -> id; titles in create get a genre if they have none, the rest are only looked up
+    return _get_or_create(
+        Genre, _lookup_genres, first_by_key((canonical_genre_title(title) for title in create), genre_key),
+        lambda key, title: {'title': title, 'title_key': key},
+        lookup_only={genre_key(title) for title in titles},
+    )
+
+
+def _lookup_subgenres(keys):
+    query = select(Subgenre.genre_id, Subgenre.subtitle_key, Subgenre.id).where(
+        Subgenre.genre_id.in_({genre_id for genre_id, _ in keys}),
+        Subgenre.subtitle_key.in_({subtitle_key for _, subtitle_key in keys}),
+    )
+    return {(genre_id, subtitle_key): subgenre_id for genre_id, subtitle_key, subgenre_id in db.session.execute(query)}
+
+
+def subgenre_ids(pairs):
+    # Map (genre_id, subtitle key) -> id for (genre_id, subtitle) pairs, creating the missing ones
+    keyed = first_by_key(((genre_id, canonical_genre_title(subtitle)) for genre_id, subtitle in pairs),
+                    lambda pair: (pair[0], genre_key(pair[1])))
+    return _get_or_create(
+        Subgenre, _lookup_subgenres, {key: subtitle for key, (_, subtitle) in keyed.items()},
+        lambda key, subtitle: {'genre_id': key[0], 'subtitle': subtitle, 'subtitle_key': key[1]},
+    )
+
+
+def venue_ids(names):
+    # Map venue key -> id for names, creating the missing ones
+    return _get_or_create(
+        Venue,
+        lambda keys: dict(db.session.execute(select(Venue.venuename_key, Venue.id).where(Venue.venuename_key.in_(keys))).all()),
+        first_by_key(names),
+        lambda key, name: {'venuename': name, 'venuename_key': key},
+    )
+
+
+def sync_associations(associations, attribute, targets, make):
+    # Point associations (e.g. dj.dj_genres) at exactly targets by attribute, writing only the
+    # difference; returns whether any row changed
+    wanted = list(dict.fromkeys(targets))
+    keep = set(wanted)
+    current = {getattr(association, attribute): association for association in associations}
+    changed = False
+    for target, association in current.items():
+        if target not in keep:
+            associations.remove(association)
+            db.session.delete(association)
+            changed = True
+    for target in wanted:
+        if target not in current:
+            associations.append(make(target))
+            changed = True
+    return changed
+
+
+def _sqlstate(error):
+    return getattr(error.orig, 'pgcode', None) or getattr(error.orig, 'sqlstate', None)
+
+
+def unique_violation_table(error):
+    # Table whose unique constraint an IntegrityError violated, or None
+    code = _sqlstate(error)
+    if code:
+        return error.orig.diag.table_name if code == UNIQUE_VIOLATION else None
+    match = SQLITE_UNIQUE_FAILED.search(str(error.orig))
+    return match.group(1) if match else None
+
+
+def _retryable(error):
+    # Lost a race with another writer, as opposed to a request that can never succeed
+    if unique_violation_table(error) in RACING_TABLES:
+        return True
+    code = _sqlstate(error)
+    if code:
+        return code in RETRYABLE_SQLSTATES
+    return 'database is locked' in str(error.orig)
+
+
+def committed(write, attempts=WRITE_ATTEMPTS):
+    # Run write() and commit; a transaction that lost a race is rolled back and retried after a
+    # jittered backoff, so write() must do all of its own reads. SQLite writers hold the writer
+    # lock from before those reads
+    for attempt in range(1, attempts + 1):
+        try:
+            begin_write(db.session)
+            result = write()
+            db.session.commit()
+            return result
+        except (IntegrityError, OperationalError) as e:
+            db.session.rollback()
+            if attempt == attempts or not _retryable(e):
+                raise
+            time.sleep(random.uniform(0, RETRY_BACKOFF_SECONDS * 2 ** attempt))
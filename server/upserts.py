@@ -0,0 +1,13 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from .config import db
+
+# insert() of each supported dialect, which adds ON CONFLICT DO NOTHING / DO UPDATE
+INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def upsert(table):
+    # INSERT into table that can take an ON CONFLICT clause on the primary's dialect
+    return INSERTS[db.engine.dialect.name](table)
@@ -0,0 +1,37 @@
+from sqlalchemy import select
+from .config import db
+from .models.dj import Dj, CatalogVersion
+from .upserts import upsert
+
+# The one catalog_version row
+CATALOG_VERSION_ID = 1
+
+
+def bump_versions(*djs):
+    # Advance the catalog counter, creating its row if missing, and stamp it on each DJ; every
+    # writer locks the row until commit, so call this last
+    statement = upsert(CatalogVersion).values(id=CATALOG_VERSION_ID, version=1)
+    version = db.session.execute(statement.on_conflict_do_update(
+        index_elements=['id'], set_={'version': CatalogVersion.version + 1}
+    ).returning(CatalogVersion.version)).scalar_one()
+    for dj in djs:
+        dj.version = version
+    return version
+
+
+def catalog_version():
+    return db.session.execute(select(CatalogVersion.version).where(CatalogVersion.id == CATALOG_VERSION_ID)).scalar() or 0
+
+
+def dj_version(dj_id):
+    return db.session.execute(select(Dj.version).where(Dj.id == dj_id)).scalar()
+
+
+def catalog_etag():
+    return f'catalog-{catalog_version()}'
+
+
+def dj_etag(dj_id):
+    # None when the DJ does not exist
+    version = dj_version(dj_id)
+    return f'dj-{dj_id}-{version}' if version is not None else None